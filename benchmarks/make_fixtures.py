@@ -0,0 +1,229 @@
+"""Generate the EFA JSON fixtures used by the benchmarks.
+
+The payloads follow the structure of the responses of the VVM EFA endpoints
+(XML_DM_REQUEST, XML_STOPFINDER_REQUEST and XML_COORD_REQUEST with
+outputFormat=json). They are generated from a fixed seed, so running this
+script again produces identical files. Recorded responses can be dropped into
+the fixtures directory under the same names instead.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
+import random
+
+FIXTURES = Path(__file__).parent / "fixtures"
+NOW = datetime(2024, 5, 14, 12, 0)
+
+LINES = [
+    ("Straßenbahn", "1", ["Grombühl", "Sanderau"]),
+    ("Straßenbahn", "2", ["Hauptbahnhof", "Zellerau"]),
+    ("Straßenbahn", "3", ["Heuchelhof", "Hauptbahnhof West"]),
+    ("Straßenbahn", "4", ["Sanderau", "Zellerau"]),
+    ("Straßenbahn", "5", ["Heuchelhof", "Rottenbauer", "Grombühl"]),
+    ("Bus", "6", ["Mainfrankentheater", "Lindleinsmühle"]),
+    ("Bus", "10", ["Sanderring", "Busbahnhof"]),
+    ("Bus", "14", ["Universität Hubland", "Busbahnhof"]),
+    ("Bus", "16", ["Lengfeld", "Busbahnhof"]),
+    ("Bus", "20", ["Rottenbauer", "Busbahnhof"]),
+    ("Bus", "29", ["Versbach", "Busbahnhof"]),
+    ("Regionalbus", "8101", ["Kitzingen", "Würzburg Busbahnhof"]),
+    ("Regionalbus", "8108", ["Ochsenfurt", "Würzburg Busbahnhof"]),
+    ("Nachtbus", "N1", ["Heuchelhof", "Grombühl"]),
+    ("Ersatzverkehr", "SEV", ["Veitshöchheim", "Hauptbahnhof"]),
+]
+
+
+def efa_datetime(moment: datetime) -> dict:
+    """Return an EFA dateTime object."""
+    return {
+        "year": str(moment.year),
+        "month": str(moment.month),
+        "day": str(moment.day),
+        "weekday": str(moment.isoweekday() % 7 + 1),
+        "hour": str(moment.hour),
+        "minute": str(moment.minute),
+    }
+
+
+def departure(rng, stop_id, stop_name, line, minutes, platform) -> dict:
+    """Return a departureList entry leaving in the given minutes."""
+    mot, number, directions = line
+    direction = rng.choice(directions)
+    origin = rng.choice([d for d in directions if d != direction] or directions)
+    delay = rng.choice([0, 0, 0, 0, 1, 1, 2, 3, 5, -1])
+    scheduled = NOW + timedelta(minutes=minutes)
+    trip = rng.randint(10000, 99999)
+    return {
+        "stopID": stop_id,
+        "x": "9.93577",
+        "y": "49.80164",
+        "mapName": "WGS84[DD.ddddd]",
+        "area": "1",
+        "platform": str(platform),
+        "platformName": f"Steig {platform}",
+        "stopName": stop_name,
+        "nameWO": stop_name.split(" ", 1)[-1],
+        "pointType": "Bussteig",
+        "countdown": str(max(minutes + delay, 0)),
+        "dateTime": efa_datetime(scheduled),
+        "realDateTime": efa_datetime(scheduled + timedelta(minutes=delay)),
+        "servingLine": {
+            "key": str(trip),
+            "code": "4" if mot == "Straßenbahn" else "5",
+            "number": number,
+            "symbol": number,
+            "motType": "4" if mot == "Straßenbahn" else "5",
+            "mtSubcode": "0",
+            "realtime": "1",
+            "direction": direction,
+            "directionFrom": origin,
+            "name": mot,
+            "delay": str(delay),
+            "liErgRiProj": {
+                "line": number,
+                "project": "j24",
+                "direction": "H",
+                "supplement": " ",
+                "network": "vvm",
+            },
+            "destID": str(rng.randint(6800000, 6899999)),
+            "stateless": f"vvm:{number}: :H:j24:{trip}",
+        },
+        "operator": {"code": "WVV", "name": "Würzburger Straßenbahn GmbH"},
+        "attrs": [{"name": "wheelchairAccess", "value": "true"}],
+    }
+
+
+def dm_response(rng, stop_id, stop_name, departures_count, lines, platforms):
+    """Return an XML_DM_REQUEST response with the given number of departures."""
+    deps = []
+    for _ in range(departures_count):
+        minutes = rng.randint(0, 120)
+        line = rng.choice(lines)
+        deps.append(
+            (
+                minutes,
+                departure(
+                    rng, stop_id, stop_name, line, minutes, rng.randint(1, platforms)
+                ),
+            )
+        )
+    deps.sort(key=lambda d: d[0])
+    return {
+        "parameters": [
+            {"name": "serverID", "value": "EFA10_01"},
+            {"name": "requestID", "value": "0"},
+        ],
+        "dm": {
+            "input": {"input": stop_id},
+            "points": {
+                "point": {
+                    "usage": "dm",
+                    "type": "any",
+                    "name": stop_name,
+                    "stateless": stop_id,
+                    "anyType": "stop",
+                    "ref": {"id": stop_id, "coords": "9.93577,49.80164"},
+                }
+            },
+        },
+        "dateTime": efa_datetime(NOW),
+        "servingLines": {
+            "lines": [
+                {"mode": {"name": line[0], "number": line[1]}} for line in lines
+            ]
+        },
+        "departureList": [d for _, d in deps],
+    }
+
+
+def dm_empty() -> dict:
+    """Return an XML_DM_REQUEST response of a stop without departures."""
+    data = dm_response(random.Random(0), "6800999", "Würzburg Ruhestraße", 0, [], 1)
+    data["departureList"] = None
+    return data
+
+
+def dm_error() -> dict:
+    """Return an XML_DM_REQUEST response for an unknown stop."""
+    return {
+        "parameters": [{"name": "serverID", "value": "EFA10_01"}],
+        "dm": {
+            "input": {"input": "0"},
+            "points": None,
+            "message": [
+                {"name": "code", "value": "-8011"},
+                {"name": "error", "value": "stop not found"},
+            ],
+        },
+    }
+
+
+def stop_finder(rng, count) -> dict:
+    """Return an XML_STOPFINDER_REQUEST response with the given number of stops."""
+    points = []
+    for i in range(count):
+        lat = 49.79 + rng.uniform(-0.05, 0.05)
+        lon = 9.95 + rng.uniform(-0.05, 0.05)
+        points.append(
+            {
+                "usage": "sf",
+                "type": "any",
+                "name": f"Würzburg, Haltestelle {i}",
+                "stateless": str(6800000 + i),
+                "anyType": "stop",
+                "quality": str(1000 - i),
+                "ref": {"id": str(6800000 + i), "coords": f"{lon:.5f},{lat:.5f}"},
+            }
+        )
+    return {"stopFinder": {"input": {"input": "würzburg"}, "points": points}}
+
+
+def coord_response(rng, count) -> dict:
+    """Return an XML_COORD_REQUEST response with the given number of stops."""
+    pins = []
+    for i in range(count):
+        lat = 49.79 + rng.uniform(-0.004, 0.004)
+        lon = 9.95 + rng.uniform(-0.004, 0.004)
+        pins.append(
+            {
+                "id": str(6800000 + i),
+                "desc": f"Haltestelle {i}",
+                "type": "STOP",
+                "coords": f"{lon:.5f},{lat:.5f}",
+                "locality": "Würzburg",
+                "attrs": [
+                    {
+                        "name": "STOP_NAME_WITH_PLACE",
+                        "value": f"Würzburg, Haltestelle {i}",
+                    },
+                    {"name": "DISTANCE", "value": str(rng.randint(10, 500))},
+                ],
+            }
+        )
+    return {"pins": pins}
+
+
+def main() -> None:
+    """Write all fixtures."""
+    rng = random.Random(20240514)
+    fixtures = {
+        "dm_small.json": dm_response(
+            rng, "6800100", "Würzburg Sanderring", 12, LINES[:3], 2
+        ),
+        "dm_large.json": dm_response(rng, "6800001", "Würzburg Hbf", 250, LINES, 12),
+        "dm_empty.json": dm_empty(),
+        "dm_error.json": dm_error(),
+        "stopfinder.json": stop_finder(rng, 40),
+        "coord.json": coord_response(rng, 25),
+    }
+    FIXTURES.mkdir(exist_ok=True)
+    for name, data in fixtures.items():
+        with open(FIXTURES / name, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    main()
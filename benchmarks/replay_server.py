@@ -0,0 +1,129 @@
+"""Local aiohttp server replaying the EFA fixtures.
+
+XML_DM_REQUEST answers depend on the requested stop id (name_dm):
+    bench:small:<n>   dm_small.json
+    bench:large:<n>   dm_large.json
+    bench:empty:<n>   dm_empty.json
+    bench:error:<n>   dm_error.json
+    bench:http500:<n> an HTTP 500 error
+Any other stop id is answered with dm_small.json. XML_STOPFINDER_REQUEST and
+XML_COORD_REQUEST always return stopfinder.json and coord.json.
+
+The fixtures are served as raw bytes exactly as stored, so the client does
+the full decoding work. Run it standalone with
+    python benchmarks/replay_server.py --port 8080
+and point VVMAccessApi.base_url at http://127.0.0.1:8080.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from aiohttp import web
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def load_fixtures() -> dict[str, bytes]:
+    """Read all fixture files into memory."""
+    return {p.stem: p.read_bytes() for p in FIXTURES.glob("*.json")}
+
+
+class ReplayServer:
+    """Serve the fixtures, optionally with a simulated upstream latency."""
+
+    def __init__(self, latency=0.0) -> None:
+        """Construct the server; latency is in seconds."""
+        self.latency = latency
+        self.requests = 0
+        self._fixtures = load_fixtures()
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    def _app(self) -> web.Application:
+        """Build the aiohttp application."""
+        app = web.Application()
+        app.router.add_get("/XML_DM_REQUEST", self._departure_monitor)
+        app.router.add_get("/XML_STOPFINDER_REQUEST", self._fixture("stopfinder"))
+        app.router.add_get("/XML_COORD_REQUEST", self._fixture("coord"))
+        return app
+
+    def _json(self, name: str) -> web.Response:
+        """Return a fixture as a JSON response."""
+        return web.Response(
+            body=self._fixtures[name],
+            content_type="application/json",
+            charset="utf-8",
+        )
+
+    def _fixture(self, name: str):
+        """Return a handler always answering with the given fixture."""
+
+        async def handler(request: web.Request) -> web.Response:
+            self.requests += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._json(name)
+
+        return handler
+
+    async def _departure_monitor(self, request: web.Request) -> web.Response:
+        """Answer a departure monitor request according to the stop id."""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parts = request.query.get("name_dm", "").split(":")
+        kind = parts[1] if len(parts) > 1 and parts[0] == "bench" else "small"
+        if kind == "http500":
+            return web.Response(status=500, text="Internal Server Error")
+        name = f"dm_{kind}"
+        if name not in self._fixtures:
+            name = "dm_small"
+        return self._json(name)
+
+    async def start(self, host="127.0.0.1", port=0) -> str:
+        """Start serving and return the base URL."""
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sockets = site._server.sockets  # pylint: disable=protected-access
+        self.url = f"http://{host}:{sockets[0].getsockname()[1]}"
+        return self.url
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(host, port, latency) -> None:
+    """Serve until cancelled."""
+    server = ReplayServer(latency)
+    url = await server.start(host, port)
+    print(f"Replaying fixtures on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    """Run the replay server standalone."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated latency in ms"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port, args.latency / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
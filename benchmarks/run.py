@@ -0,0 +1,374 @@
+"""Benchmarks of the hot paths of the VVM integration.
+
+Measures, using the fixtures in benchmarks/fixtures:
+    decode      JSON decoding of the departure monitor payloads
+    parse       VVMStopMonitor.get_stop_departures, cold (full parse) and warm
+                (payload unchanged apart from the countdowns)
+    filter      VVMStopMonitorHA.filter_departure_in per departure
+    memory      allocations of a single poll and the memory retained per stop,
+                traced with tracemalloc
+    end_to_end  update latency of 1, 10, 100 and 1000 simulated stops polled
+                through the local replay server with the hub's concurrency
+
+The results are written as JSON. Every metric is suffixed with its unit
+(_us, _ms, _s, _bytes) and lower is better, so two result files can be
+compared with --compare, which exits with status 1 on regressions.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare results.json --threshold 0.2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+from pathlib import Path
+import platform
+import sys
+import time
+import tracemalloc
+import types
+
+from replay_server import ReplayServer, load_fixtures
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE_DIR = ROOT / "custom_components" / "vvm_public_transport"
+PACKAGE = "vvm_public_transport"
+STOP_COUNTS = (1, 10, 100, 1000)
+MIN_SAMPLES = 200
+UNITS = ("_us", "_ms", "_s", "_bytes")
+
+
+def load_integration():
+    """Import the Home Assistant independent modules of the integration.
+
+    The package __init__ needs Home Assistant, so the modules are imported into
+    a bare package object instead.
+    """
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [str(PACKAGE_DIR)]
+    sys.modules[PACKAGE] = package
+    return (
+        importlib.import_module(f"{PACKAGE}.vvm_access"),
+        importlib.import_module(f"{PACKAGE}.const"),
+        importlib.import_module(f"{PACKAGE}.resilience"),
+    )
+
+
+vvm_access, const, resilience = load_integration()
+
+
+def percentile(values, p) -> float:
+    """Return the nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def best_of(func, number, repeat=5) -> float:
+    """Return the fastest time of a call in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+async def async_best_of(func, number, repeat=5) -> float:
+    """Return the fastest time of an awaited call in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+class FixtureStopMonitor(vvm_access.VVMStopMonitor):
+    """Stop monitor answering from a decoded payload instead of the network."""
+
+    def __init__(self, stop_id, payload) -> None:
+        """Construct the monitor serving the payload."""
+        super().__init__(stop_id)
+        self.payload = payload
+
+    async def get_departure_monitor_request(self, stop_id, metrics=None, pruning=None):
+        """Return the payload."""
+        return self.payload
+
+
+def fixture_monitor(payload, timespan=30):
+    """Return a VVMStopMonitorHA polling the payload."""
+    monitor = vvm_access.VVMStopMonitorHA("bench", "Bench", timespan)
+    monitor.api = FixtureStopMonitor("bench", payload)
+    return monitor
+
+
+def bench_decode(raw) -> dict:
+    """Measure the JSON decoding of the departure monitor payloads."""
+    return {
+        name: {
+            "size_bytes": len(raw[name]),
+            "decode_us": best_of(lambda b=raw[name]: vvm_access.json_loads(b), 50),
+        }
+        for name in ("dm_small", "dm_large", "dm_empty")
+    }
+
+
+async def bench_parse(payloads) -> dict:
+    """Measure get_stop_departures on full and on reused parses."""
+    results = {}
+    for name in ("dm_small", "dm_large", "dm_empty"):
+        api = FixtureStopMonitor("bench", payloads[name])
+
+        async def cold(api=api):
+            api._fingerprint = None  # pylint: disable=protected-access
+            await api.get_stop_departures(30)
+
+        async def warm(api=api):
+            await api.get_stop_departures(30)
+
+        departures = len(payloads[name].get("departureList") or [])
+        results[name] = {
+            "departures": departures,
+            "cold_us": await async_best_of(cold, 100),
+            "warm_us": await async_best_of(warm, 100),
+        }
+    return results
+
+
+async def bench_filter(payloads) -> dict:
+    """Measure the cost of filter_departure_in per departure."""
+    api = FixtureStopMonitor("bench", payloads["dm_large"])
+    departures = await api.get_stop_departures(120)
+    configs = {
+        "none": {},
+        "types": {"types": [const.V_TYPE_TRAM, const.V_TYPE_BUS]},
+        "numbers": {"numbers": ["1-5", "!3", "10", "N1"]},
+        "complex": {
+            "types": [const.V_TYPE_TRAM, const.V_TYPE_BUS, const.V_TYPE_REGIONAL_BUS],
+            "numbers": ["1-29", "!4", "8101"],
+            "direction": ["Heuchelhof", "Busbahnhof", "!Sanderau"],
+            "platform": ["1", "2", "3", "!4"],
+        },
+    }
+    results = {"departures": len(departures)}
+    for name, config in configs.items():
+        monitor = vvm_access.VVMStopMonitorHA("bench", "Bench", 120)
+        if "types" in config:
+            monitor.filter_types = config["types"]
+        if "numbers" in config:
+            monitor.filter_nums = config["numbers"]
+        if "direction" in config:
+            monitor.filter_direction = config["direction"]
+        if "platform" in config:
+            monitor.filter_platform = config["platform"]
+        check = monitor.filter_departure_in
+
+        def run(check=check):
+            for d in departures:
+                check(d)
+
+        results[name] = {
+            "matched": sum(1 for d in departures if check(d)),
+            "per_departure_us": best_of(run, 200) / len(departures),
+        }
+    return results
+
+
+async def bench_memory(payloads) -> dict:
+    """Trace the allocations of a poll and the memory retained per stop."""
+    results = {}
+    for name in ("dm_small", "dm_large"):
+        monitor = fixture_monitor(payloads[name])
+        tracemalloc.start()
+        await monitor.async_update()
+        cold_size, cold_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await monitor.async_update()
+        warm_size, warm_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            "cold_poll_peak_bytes": cold_peak,
+            "cold_poll_retained_bytes": cold_size,
+            "warm_poll_peak_bytes": warm_peak - base,
+            "warm_poll_retained_bytes": warm_size - base,
+        }
+
+    count = 1000
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    monitors = [fixture_monitor(payloads["dm_small"]) for _ in range(count)]
+    for monitor in monitors:
+        await monitor.async_update()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    results["retained_per_stop_bytes"] = retained / count
+    return results
+
+
+def stop_kind(i: int) -> str:
+    """Return the fixture a simulated stop is answered with."""
+    if i % 100 == 2:
+        return "error"
+    if i % 50 == 1:
+        return "empty"
+    if i % 20 == 0:
+        return "large"
+    return "small"
+
+
+async def bench_end_to_end(latency, rounds, keep_rate_limit) -> dict:
+    """Poll simulated stops through the replay server."""
+    api = vvm_access.VVMAccessApi
+    if not keep_rate_limit:
+        api._rate_limit = resilience.TokenBucket(  # pylint: disable=protected-access
+            rate=1e9, capacity=1e9
+        )
+    # the rounds follow each other within the TTL of the shared responses,
+    # which would otherwise answer all warm rounds without any request
+    api.departure_cache.ttl = 0
+    server = ReplayServer(latency)
+    api.base_url = await server.start()
+    api.open_session()
+    results = {}
+    try:
+        for count in STOP_COUNTS:
+            monitors = [
+                vvm_access.VVMStopMonitorHA(f"bench:{stop_kind(i)}:{i}", f"Stop {i}")
+                for i in range(count)
+            ]
+            semaphore = asyncio.Semaphore(const.DEFAULT_MAX_CONCURRENT_REQUESTS)
+            cold = []
+            warm = []
+
+            async def update(monitor, latencies):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await monitor.async_update()
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(update(m, cold) for m in monitors))
+            cold_round = time.perf_counter() - start
+            # few stops need more rounds for stable percentiles
+            warm_rounds = max(rounds, -(-MIN_SAMPLES // count))
+            start = time.perf_counter()
+            for _ in range(warm_rounds):
+                await asyncio.gather(*(update(m, warm) for m in monitors))
+            warm_round = (time.perf_counter() - start) / warm_rounds
+
+            results[str(count)] = {
+                "cold_round_s": cold_round,
+                "warm_round_s": warm_round,
+                "update_mean_ms": sum(warm) / len(warm) * 1e3,
+                "update_p50_ms": percentile(warm, 50) * 1e3,
+                "update_p95_ms": percentile(warm, 95) * 1e3,
+                "update_p99_ms": percentile(warm, 99) * 1e3,
+                "stale": sum(1 for m in monitors if m.stale),
+            }
+    finally:
+        await api.async_close_session()
+        await server.stop()
+    return results
+
+
+async def run(args) -> dict:
+    """Run all benchmarks."""
+    raw = load_fixtures()
+    payloads = {name: json.loads(data) for name, data in raw.items()}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "json_decoder": vvm_access.json_loads.__module__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "latency_ms": args.latency,
+            "rounds": args.rounds,
+            "rate_limited": args.keep_rate_limit,
+        },
+        "decode": bench_decode(raw),
+        "parse": await bench_parse(payloads),
+        "filter": await bench_filter(payloads),
+        "memory": await bench_memory(payloads),
+        "end_to_end": await bench_end_to_end(
+            args.latency / 1000, args.rounds, args.keep_rate_limit
+        ),
+    }
+
+
+def flatten(results, prefix="") -> dict[str, float]:
+    """Return the metrics of the results as a flat mapping."""
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and key.endswith(UNITS):
+            flat[path] = value
+    return flat
+
+
+def compare(results, baseline, threshold) -> list[str]:
+    """Return the metrics that got worse than the baseline by the threshold."""
+    old = flatten(baseline)
+    regressions = []
+    for key, value in flatten(results).items():
+        if key in old and old[key] > 0 and value > old[key] * (1 + threshold):
+            regressions.append(
+                f"{key}: {old[key]:.6g} -> {value:.6g}"
+                f" (+{(value / old[key] - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated latency in ms"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=3, help="minimum warm end-to-end rounds"
+    )
+    parser.add_argument(
+        "--keep-rate-limit",
+        action="store_true",
+        help="keep the request rate limit of the integration",
+    )
+    parser.add_argument("--compare", help="baseline JSON results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,257 @@
 """The vvm_transport integration."""
 from __future__ import annotations
 
-from datetime import timedelta
+import csv
 import logging
+import os
+
+import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 
+from .catalog import load_stops_file
 from .const import (
+    ATTR_CONFIG_ENTRY_ID,
+    ATTR_LINE,
+    ATTR_PATH,
+    CONF_ATTRIBUTE_MODE,
+    CONF_DESTINATION,
+    CONF_DESTINATION_ID,
+    CONF_ENTRY_TYPE,
     CONF_FILTER_DIRECTION,
     CONF_FILTER_NUM,
+    CONF_FILTER_PLATFORM,
     CONF_FILTER_TYPE,
+    CONF_ORIGIN,
+    CONF_ORIGIN_ID,
+    CONF_QUIET_HOURS,
     CONF_STOP_ID,
     CONF_TIMEFRAME,
+    DATA_DELAY_HISTORY,
+    DATA_HUB,
+    DATA_SNAPSHOTS,
+    DATA_TRIPS,
     DOMAIN,
+    ENTRY_TYPE_BOARD,
+    ENTRY_TYPE_STOP,
+    ENTRY_TYPE_TRIP,
+    SERVICE_GET_DELAY_STATISTICS,
+    SERVICE_GET_DEPARTURES,
+    SERVICE_IMPORT_STOP_CATALOG,
+    SIGNAL_STOP_ADDED,
+    SIGNAL_STOP_REMOVED,
+    TRIP_POLL_INTERVAL,
 )
-from .vvm_access import VVMStopMonitorHA
+from .hub import VVMPollingHub
+from .storage import (
+    VVMDelayHistoryStore,
+    VVMSnapshotStore,
+    async_load_lookup_data,
+    async_save_lookup_data,
+)
+from .trip import VVMTripMonitor
+from .vvm_access import VVMAccessApi, VVMStopMonitorHA
+from .websocket import async_register_websocket_commands
 
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.SWITCH, Platform.TEXT]
+BOARD_PLATFORMS: list[Platform] = [Platform.SENSOR]
+TRIP_PLATFORMS: list[Platform] = [Platform.SENSOR]
+
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+IMPORT_STOP_CATALOG_SCHEMA = vol.Schema({vol.Required(ATTR_PATH): cv.string})
+GET_DEPARTURES_SCHEMA = vol.Schema({vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string})
+GET_DELAY_STATISTICS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_LINE): cv.string,
+    }
+)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the integration-wide services and load the persisted stop data."""
+    snapshots = hass.data[DATA_SNAPSHOTS] = VVMSnapshotStore(hass)
+    await snapshots.async_load()
+    delay_history = hass.data[DATA_DELAY_HISTORY] = VVMDelayHistoryStore(hass)
+    await delay_history.async_load()
+
+    async def async_import_stop_catalog(call: ServiceCall) -> None:
+        """Import the stop catalog from a CSV or JSON file."""
+        path = call.data[ATTR_PATH]
+        if not os.path.isabs(path):
+            path = hass.config.path(path)
+        if not hass.config.is_allowed_path(path):
+            raise HomeAssistantError(f"Access to {path} is not allowed")
+        try:
+            stops = await hass.async_add_executor_job(load_stops_file, path)
+        except (OSError, ValueError, csv.Error) as e:
+            raise HomeAssistantError(f"Could not import stops from {path}: {e}") from e
+
+        await async_load_lookup_data(hass)
+        catalog = VVMAccessApi.stop_catalog
+        catalog.add_stops(stops)
+        catalog.complete = True
+        catalog.dirty = True
+        async_save_lookup_data(hass)
+        _LOGGER.info("Imported %d stops into the stop catalog", len(stops))
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_IMPORT_STOP_CATALOG,
+        async_import_stop_catalog,
+        schema=IMPORT_STOP_CATALOG_SCHEMA,
+    )
+
+    def get_monitor(call: ServiceCall) -> VVMStopMonitorHA:
+        """Return the monitor of the stop a service is called for."""
+        entry_id = call.data[ATTR_CONFIG_ENTRY_ID]
+        if (coordinator := hass.data.get(DOMAIN, {}).get(entry_id)) is None:
+            raise HomeAssistantError(f"No VVM stop loaded for config entry {entry_id}")
+        return coordinator.data
+
+    async def async_get_departures(call: ServiceCall) -> ServiceResponse:
+        """Return all departures of a stop, regardless of the attribute mode."""
+        monitor = get_monitor(call)
+        return {
+            "stop_id": monitor.stop_id,
+            "stop_name": monitor.stop_name,
+            "stale": monitor.stale,
+            "last_updated": monitor.last_updated.isoformat()
+            if monitor.last_updated is not None
+            else None,
+            "departures": [
+                {
+                    **d.as_dict(),
+                    "should_time": d.should_time.isoformat(),
+                    "real_time": d.real_time.isoformat(),
+                }
+                for d in monitor.departures
+            ],
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_DEPARTURES,
+        async_get_departures,
+        schema=GET_DEPARTURES_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_get_delay_statistics(call: ServiceCall) -> ServiceResponse:
+        """Return the delay statistics of a stop, or of one of its lines."""
+        monitor = get_monitor(call)
+        stats = monitor.delay_history.stats()
+        if (line := call.data.get(ATTR_LINE)) is None:
+            return {"stop_id": monitor.stop_id, "stop_name": monitor.stop_name, **stats}
+        if (line_stats := stats["lines"].get(line)) is None:
+            raise HomeAssistantError(
+                f"No delays recorded for line {line} at {monitor.stop_name}"
+            )
+        return {
+            "stop_id": monitor.stop_id,
+            "stop_name": monitor.stop_name,
+            "line": line,
+            **line_stats,
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_DELAY_STATISTICS,
+        async_get_delay_statistics,
+        schema=GET_DELAY_STATISTICS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    async_register_websocket_commands(hass)
+    return True
+
+
+def is_board(entry: ConfigEntry) -> bool:
+    """Check if the config entry is a departure board of several stops."""
+    return entry.data.get(CONF_ENTRY_TYPE, ENTRY_TYPE_STOP) == ENTRY_TYPE_BOARD
+
+
+def is_trip(entry: ConfigEntry) -> bool:
+    """Check if the config entry is a connection between two stops."""
+    return entry.data.get(CONF_ENTRY_TYPE, ENTRY_TYPE_STOP) == ENTRY_TYPE_TRIP
+
+
+def get_hub(hass: HomeAssistant) -> VVMPollingHub:
+    """Return the polling hub, creating it for the first stop or connection."""
+    if (hub := hass.data.get(DATA_HUB)) is None:
+        hub = hass.data[DATA_HUB] = VVMPollingHub(hass)
+    return hub
+
+
+async def async_release_hub(hass: HomeAssistant) -> None:
+    """Shut the polling hub down once no stop or connection is loaded."""
+    if hass.data.get(DOMAIN) or hass.data.get(DATA_TRIPS):
+        return
+    if (hub := hass.data.pop(DATA_HUB, None)) is not None:
+        await hub.async_shutdown()
+
+
+async def async_setup_trip_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Set up the connection between two stops of a config entry."""
+    monitor = VVMTripMonitor(
+        entry.data[CONF_ORIGIN_ID],
+        entry.data[CONF_ORIGIN],
+        entry.data[CONF_DESTINATION_ID],
+        entry.data[CONF_DESTINATION],
+    )
+    # check the delays with the departures of the hub
+    monitor.departure_source = get_hub(hass).async_departures
+
+    async def async_update_data() -> VVMTripMonitor:
+        """Update the connections, mostly from the cache."""
+        await monitor.async_update()
+        return monitor
+
+    coordinator = DataUpdateCoordinator(
+        hass,
+        _LOGGER,
+        name="vvm_public_transport_trip",
+        update_method=async_update_data,
+        update_interval=TRIP_POLL_INTERVAL,
+    )
+    try:
+        await coordinator.async_config_entry_first_refresh()
+    except ConfigEntryNotReady:
+        await async_release_hub(hass)
+        raise
+    hass.data.setdefault(DATA_TRIPS, {})[entry.entry_id] = coordinator
+    await hass.config_entries.async_forward_entry_setups(entry, TRIP_PLATFORMS)
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up vvm_transport from a config entry."""
+    # every entry holds the shared HTTP session until it is unloaded, which
+    # includes a failed setup
+    VVMAccessApi.acquire_session()
+    entry.async_on_unload(VVMAccessApi.async_release_session)
+    if is_board(entry):
+        # the board entity follows the stop entries as they are loaded
+        await hass.config_entries.async_forward_entry_setups(entry, BOARD_PLATFORMS)
+        return True
+    if is_trip(entry):
+        return await async_setup_trip_entry(hass, entry)
+
+    hub = get_hub(hass)
     api = VVMStopMonitorHA(
         entry.data[CONF_STOP_ID], entry.title, entry.data[CONF_TIMEFRAME]
     )
@@ -37,32 +263,72 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             api.filter_nums = entry.options[CONF_FILTER_NUM]
         if CONF_FILTER_DIRECTION in entry.options:
             api.filter_direction = entry.options[CONF_FILTER_DIRECTION]
+        if CONF_FILTER_PLATFORM in entry.options:
+            api.filter_platform = entry.options[CONF_FILTER_PLATFORM]
         if CONF_TIMEFRAME in entry.options:
             api.timespan = entry.options[CONF_TIMEFRAME]
+        if CONF_QUIET_HOURS in entry.options:
+            api.quiet_hours = entry.options[CONF_QUIET_HOURS]
+        if CONF_ATTRIBUTE_MODE in entry.options:
+            api.attribute_mode = entry.options[CONF_ATTRIBUTE_MODE]
 
-    async def async_update_data() -> VVMStopMonitorHA:
-        """Fetch data from the API."""
-        await api.async_update()
-        return api
+    delay_history: VVMDelayHistoryStore = hass.data[DATA_DELAY_HISTORY]
+    api.delay_history = delay_history.async_get(entry.entry_id)
 
-    coordinator = DataUpdateCoordinator(
-        hass,
-        _LOGGER,
-        name="vvm_public_transport_stop",
-        update_method=async_update_data,
-        update_interval=timedelta(minutes=1),
-    )
+    coordinator = hub.async_add_monitor(entry.entry_id, api)
+
+    snapshots: VVMSnapshotStore = hass.data[DATA_SNAPSHOTS]
+    snapshot = snapshots.get(entry.entry_id)
+    if snapshot is not None and api.restore_snapshot(snapshot):
+        # come up from the snapshot right away, the hub polls the live data in
+        # the stop's slot so that restarts do not poll all stops at once
+        coordinator.async_set_updated_data(api)
+    else:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except ConfigEntryNotReady:
+            hub.async_remove_monitor(entry.entry_id)
+            await async_release_hub(hass)
+            raise
 
-    await coordinator.async_config_entry_first_refresh()
+    snapshots.async_track(entry.entry_id, api)
+    entry.async_on_unload(coordinator.async_add_listener(snapshots.async_schedule_save))
+    entry.async_on_unload(
+        coordinator.async_add_listener(delay_history.async_schedule_save)
+    )
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = coordinator
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    async_dispatcher_send(hass, SIGNAL_STOP_ADDED, entry.entry_id, coordinator)
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
+    if is_board(entry):
+        return await hass.config_entries.async_unload_platforms(entry, BOARD_PLATFORMS)
+    if is_trip(entry):
+        if unload_ok := await hass.config_entries.async_unload_platforms(
+            entry, TRIP_PLATFORMS
+        ):
+            hass.data[DATA_TRIPS].pop(entry.entry_id)
+            await async_release_hub(hass)
+        return unload_ok
+
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         hass.data[DOMAIN].pop(entry.entry_id)
+        async_dispatcher_send(hass, SIGNAL_STOP_REMOVED, entry.entry_id)
+        hub: VVMPollingHub = hass.data[DATA_HUB]
+        hub.async_remove_monitor(entry.entry_id)
+        hass.data[DATA_SNAPSHOTS].async_untrack(entry.entry_id)
+        hass.data[DATA_DELAY_HISTORY].async_untrack(entry.entry_id)
+        await async_release_hub(hass)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the departure snapshot and delay history of a removed entry."""
+    if not is_board(entry) and not is_trip(entry):
+        hass.data[DATA_SNAPSHOTS].async_remove(entry.entry_id)
+        hass.data[DATA_DELAY_HISTORY].async_remove(entry.entry_id)
@@ -0,0 +1,82 @@
+"""Departure board merging the departures of several stops."""
+from __future__ import annotations
+
+import heapq
+from itertools import islice
+from operator import attrgetter
+
+from .departure import Departure
+
+_real_time = attrgetter("real_time")
+
+
+def _board_key(entry: tuple[Departure, str]):
+    """Order board entries by their realtime departure."""
+    return entry[0].real_time
+
+
+class DepartureBoard:
+    """The first departures of several stops, ordered by their realtime.
+
+    Every stop contributes its departure list. Only the list of a stop that
+    changed is re-sorted, and the board is then produced by a lazy k-way
+    merge that stops after max_departures entries. A trip seen at several
+    stops is only listed at the stop it departs from first.
+    """
+
+    def __init__(self, max_departures: int) -> None:
+        """Construct an empty board."""
+        self.max_departures = max_departures
+        self._sources: dict[str, list[Departure]] = {}
+        self._sorted: dict[str, list[tuple[Departure, str]]] = {}
+        self.departures: list[tuple[Departure, str]] = []
+
+    def update_stop(self, key: str, stop_name: str, departures) -> bool:
+        """Take the current departures of a stop.
+
+        Returns False if the board did not change.
+        """
+        if self._sources.get(key) is departures:
+            return False
+        self._sources[key] = departures
+        # the lists are ordered by schedule, delays can reorder a few entries
+        self._sorted[key] = [
+            (d, stop_name) for d in sorted(departures, key=_real_time)
+        ]
+        return self._merge()
+
+    def remove_stop(self, key: str) -> bool:
+        """Drop the departures of a stop.
+
+        Returns False if the board did not change.
+        """
+        if self._sources.pop(key, None) is None:
+            return False
+        del self._sorted[key]
+        return self._merge()
+
+    def _merge(self) -> bool:
+        """Merge the stops into the board, returning False if it is unchanged."""
+        seen = set()
+
+        def unique(entries):
+            for entry in entries:
+                trip = entry[0].trip
+                if trip:
+                    if trip in seen:
+                        continue
+                    seen.add(trip)
+                yield entry
+
+        merged = list(
+            islice(
+                unique(heapq.merge(*self._sorted.values(), key=_board_key)),
+                self.max_departures,
+            )
+        )
+        if len(merged) == len(self.departures) and all(
+            a[0] is b[0] and a[1] == b[1] for a, b in zip(merged, self.departures)
+        ):
+            return False
+        self.departures = merged
+        return True
@@ -0,0 +1,254 @@
+"""Local catalog of VVM stops with spatial and name indexes."""
+from __future__ import annotations
+
+import csv
+import json
+import math
+
+from .const import (
+    CATALOG_GRID_CELL,
+    CATALOG_MAX_COVERED_AREAS,
+    CATALOG_MAX_SEARCHED_KEYWORDS,
+)
+from .lookup_cache import normalize_keyword
+from .metrics import rate
+
+EARTH_RADIUS = 6371000.0
+
+
+def distance(lat1, lon1, lat2, lon2) -> float:
+    """Return the approximate distance in meters between two coordinates."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.hypot(x, y)
+
+
+def trigrams(text: str) -> set[str]:
+    """Return the trigrams of the words of a normalized text."""
+    return {w[i : i + 3] for w in text.split() for i in range(len(w) - 2)}
+
+
+def load_stops_file(path: str) -> list[dict]:
+    """Read stops from a CSV (e.g. GTFS stops.txt) or JSON file.
+
+    CSV files need the columns id, name, lat and lon, or their GTFS names
+    stop_id, stop_name, stop_lat and stop_lon. JSON files contain a list of
+    objects with the keys id, name, lat and lon. The ids must be EFA stop ids.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    stops = []
+    for row in rows:
+        stop_id = row.get("id", row.get("stop_id"))
+        name = row.get("name", row.get("stop_name"))
+        if not stop_id or not name:
+            continue
+        stop = {"id": str(stop_id), "name": name}
+        lat = row.get("lat", row.get("stop_lat"))
+        lon = row.get("lon", row.get("stop_lon"))
+        if lat not in (None, "") and lon not in (None, ""):
+            stop["lat"] = float(lat)
+            stop["lon"] = float(lon)
+        stops.append(stop)
+    return stops
+
+
+class StopCatalog:
+    """Stops with a grid index over their coordinates and a trigram name index.
+
+    The catalog is filled from the results of stop-finder and nearby-stop
+    requests, or imported at once from a file. A nearby query only counts as a
+    hit inside an area that was fully downloaded before, and a name search
+    only for a keyword a stop-finder response answered before, or when the
+    catalog was imported.
+    """
+
+    def __init__(self) -> None:
+        """Construct an empty catalog."""
+        self._stops: dict[str, tuple[str, float | None, float | None]] = {}
+        self._grid: dict[tuple[int, int], set[str]] = {}
+        self._names: dict[str, set[str]] = {}
+        self._covered: list[tuple[float, float, float]] = []
+        self._searched: dict[str, None] = {}
+        self.complete = False
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of stops in the catalog."""
+        return len(self._stops)
+
+    @staticmethod
+    def _cell(lat, lon) -> tuple[int, int]:
+        """Return the grid cell of a coordinate."""
+        return (
+            math.floor(lat / CATALOG_GRID_CELL),
+            math.floor(lon / CATALOG_GRID_CELL),
+        )
+
+    def _remove(self, stop_id: str) -> None:
+        """Remove a stop from all indexes."""
+        name, lat, lon = self._stops.pop(stop_id)
+        if lat is not None:
+            self._grid[self._cell(lat, lon)].discard(stop_id)
+        for t in trigrams(normalize_keyword(name)):
+            self._names[t].discard(stop_id)
+
+    def add_stop(self, stop_id: str, name: str, lat=None, lon=None) -> None:
+        """Add or update a stop."""
+        if (old := self._stops.get(stop_id)) is not None:
+            if lat is None:
+                lat, lon = old[1], old[2]
+            if old == (name, lat, lon):
+                return
+            self._remove(stop_id)
+        self._stops[stop_id] = (name, lat, lon)
+        if lat is not None:
+            self._grid.setdefault(self._cell(lat, lon), set()).add(stop_id)
+        for t in trigrams(normalize_keyword(name)):
+            self._names.setdefault(t, set()).add(stop_id)
+        self.dirty = True
+
+    def add_stops(self, stops: list[dict]) -> None:
+        """Add stops in the form returned by the VVM access API."""
+        for s in stops:
+            self.add_stop(s["id"], s["name"], s.get("lat"), s.get("lon"))
+
+    def add_covered_area(self, lat, lon, radius) -> None:
+        """Record that all stops within the radius around lat/lon are known."""
+        self._covered.append((lat, lon, radius))
+        del self._covered[:-CATALOG_MAX_COVERED_AREAS]
+        self.dirty = True
+
+    def add_searched_keyword(self, keyword: str) -> None:
+        """Record that all stops found by a keyword are known."""
+        keyword = normalize_keyword(keyword)
+        self._searched.pop(keyword, None)
+        self._searched[keyword] = None
+        for old in list(self._searched)[:-CATALOG_MAX_SEARCHED_KEYWORDS]:
+            del self._searched[old]
+        self.dirty = True
+
+    def is_covered(self, lat, lon, radius) -> bool:
+        """Check if the area was fully downloaded before."""
+        if self.complete:
+            return True
+        return any(
+            distance(lat, lon, clat, clon) + radius <= cradius
+            for clat, clon, cradius in self._covered
+        )
+
+    def nearby(self, lat, lon, radius, max_results=None) -> list[dict] | None:
+        """Return the stops within the radius ordered by distance.
+
+        Returns None if the area is not covered by the catalog.
+        """
+        if not self.is_covered(lat, lon, radius):
+            self.misses += 1
+            return None
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        lat_lo, lon_lo = self._cell(lat - dlat, lon - dlon)
+        lat_hi, lon_hi = self._cell(lat + dlat, lon + dlon)
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) > len(self._grid):
+            cells = [
+                ids
+                for (clat, clon), ids in self._grid.items()
+                if lat_lo <= clat <= lat_hi and lon_lo <= clon <= lon_hi
+            ]
+        else:
+            cells = [
+                self._grid[(clat, clon)]
+                for clat in range(lat_lo, lat_hi + 1)
+                for clon in range(lon_lo, lon_hi + 1)
+                if (clat, clon) in self._grid
+            ]
+        found = []
+        for ids in cells:
+            for stop_id in ids:
+                name, slat, slon = self._stops[stop_id]
+                d = distance(lat, lon, slat, slon)
+                if d <= radius:
+                    found.append((d, stop_id, name))
+        found.sort()
+        if max_results is not None:
+            found = found[:max_results]
+        self.hits += 1
+        return [{"id": stop_id, "name": name} for _, stop_id, name in found]
+
+    def search(self, keyword: str, max_results=None) -> list[dict] | None:
+        """Return the stops whose names contain every word of the keyword.
+
+        Returns None if nothing was found, or if the catalog may not know all
+        stops of the keyword, so the caller can ask the API.
+        """
+        keyword = normalize_keyword(keyword)
+        if not keyword or not (self.complete or keyword in self._searched):
+            self.misses += 1
+            return None
+        candidates = None
+        for t in trigrams(keyword):
+            ids = self._names.get(t)
+            if not ids:
+                self.misses += 1
+                return None
+            candidates = set(ids) if candidates is None else candidates & ids
+        if candidates is None:
+            # only words shorter than a trigram, check every stop
+            candidates = self._stops.keys()
+        words = keyword.split()
+        found = []
+        for stop_id in candidates:
+            name = self._stops[stop_id][0]
+            lname = normalize_keyword(name)
+            if all(w in lname for w in words):
+                found.append(
+                    (not lname.startswith(words[0]), len(name), name, stop_id)
+                )
+        if not found:
+            self.misses += 1
+            return None
+        found.sort()
+        if max_results is not None:
+            found = found[:max_results]
+        self.hits += 1
+        return [{"id": stop_id, "name": name} for _, _, name, stop_id in found]
+
+    def stats(self) -> dict:
+        """Return the size and hit counts of the catalog."""
+        return {
+            "stops": len(self._stops),
+            "covered_areas": len(self._covered),
+            "searched_keywords": len(self._searched),
+            "complete": self.complete,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": rate(self.hits, self.misses),
+        }
+
+    def as_dict(self) -> dict:
+        """Return the catalog contents in a form suitable for storage."""
+        self.dirty = False
+        return {
+            "stops": [
+                [stop_id, name, lat, lon]
+                for stop_id, (name, lat, lon) in self._stops.items()
+            ],
+            "covered": self._covered,
+            "searched": list(self._searched),
+            "complete": self.complete,
+        }
+
+    def load(self, data: dict) -> None:
+        """Load catalog contents previously returned by as_dict."""
+        for stop_id, name, lat, lon in data.get("stops", []):
+            self.add_stop(stop_id, name, lat, lon)
+        self._covered = [tuple(c) for c in data.get("covered", [])]
+        self._searched = dict.fromkeys(data.get("searched", []))
+        self.complete = data.get("complete", False)
+        self.dirty = False
@@ -7,26 +7,51 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries
+from homeassistant.const import CONF_NAME
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 import homeassistant.helpers.config_validation as cv
 
 from .const import (
+    ATTRIBUTE_MODE_FULL,
+    ATTRIBUTE_MODES,
+    CONF_ATTRIBUTE_MODE,
+    CONF_DESTINATION,
+    CONF_DESTINATION_ID,
     CONF_FILTER_DIRECTION,
     CONF_FILTER_NUM,
+    CONF_FILTER_PLATFORM,
+    CONF_ENTRY_TYPE,
     CONF_FILTER_TYPE,
+    CONF_MAX_DEPARTURES,
+    CONF_ORIGIN,
+    CONF_ORIGIN_ID,
+    CONF_QUIET_HOURS,
     CONF_STATION,
     CONF_STOP_ID,
+    CONF_STOPS,
     CONF_TIMEFRAME,
+    DATA_HUB,
+    DEFAULT_BOARD_MAX_DEPARTURES,
     DOMAIN,
+    ENTRY_TYPE_BOARD,
+    ENTRY_TYPE_STOP,
+    ENTRY_TYPE_TRIP,
+    NEARBY_MAX_RESULTS,
+    NEARBY_RADIUS,
     V_TYPE_LIST,
 )
+from .hub import VVMPollingHub
+from .storage import async_load_lookup_data, async_save_lookup_data
 from .vvm_access import VVMAccessApi, VVMStopMonitor
 
 _LOGGER = logging.getLogger(__name__)
 
 STEP_STATION_DATA_SCHEMA = vol.Schema({vol.Required(CONF_STATION): str})
+STEP_TRIP_DATA_SCHEMA = vol.Schema(
+    {vol.Required(CONF_ORIGIN): str, vol.Required(CONF_DESTINATION): str}
+)
 
 
 async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str, Any]:
@@ -54,6 +79,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         super().__init__()
         self.stops = []
         self.station_names = []
+        self.trip_stops: dict[str, list] = {}
 
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
@@ -62,6 +88,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         menu_options = {
             "manual_search": "Search by name",
             "nearby_select": "Near home",
+            "board": "Departure board of several stops",
+            "trip": "Connection between two stops",
         }
         return self.async_show_menu(step_id="user", menu_options=menu_options)
 
@@ -73,9 +101,23 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         try:
             # info = await validate_input(self.hass, user_input)
-            self.stops = await VVMAccessApi.get_stops_nearby(
-                lat=self.hass.config.latitude, lon=self.hass.config.longitude
-            )
+            await async_load_lookup_data(self.hass)
+            lat = self.hass.config.latitude
+            lon = self.hass.config.longitude
+            catalog = VVMAccessApi.stop_catalog
+            stops = catalog.nearby(lat, lon, NEARBY_RADIUS, NEARBY_MAX_RESULTS)
+            if stops is None:
+                stops = await self._async_request(
+                    VVMAccessApi.get_stops_nearby(
+                        lat=lat, lon=lon, radius=NEARBY_RADIUS
+                    )
+                )
+                stops = (
+                    catalog.nearby(lat, lon, NEARBY_RADIUS, NEARBY_MAX_RESULTS)
+                    or stops[:NEARBY_MAX_RESULTS]
+                )
+                async_save_lookup_data(self.hass)
+            self.stops = stops
         except Exception:  # pylint: disable=broad-except
             _LOGGER.exception("Unexpected exception")
             errors["base"] = "unknown"
@@ -93,7 +135,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         if user_input is not None:
             try:
                 # info = await validate_input(self.hass, user_input)
-                self.stops = await VVMAccessApi.get_stop_list(user_input[CONF_STATION])
+                self.stops = await self._async_search_stops(user_input[CONF_STATION])
             except Exception:  # pylint: disable=broad-except
                 _LOGGER.exception("Unexpected exception")
                 errors["base"] = "unknown"
@@ -111,6 +153,116 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="manual_search", data_schema=STEP_STATION_DATA_SCHEMA, errors=errors
         )
 
+    async def _async_search_stops(self, keyword) -> list:
+        """Search stops by name, in the stop catalog first."""
+        await async_load_lookup_data(self.hass)
+        stops = VVMAccessApi.stop_catalog.search(keyword)
+        if stops is None:
+            stops = await self._async_request(VVMAccessApi.get_stop_list(keyword))
+            async_save_lookup_data(self.hass)
+        return stops
+
+    @staticmethod
+    async def _async_request(request):
+        """Await a request of the flow, holding the shared HTTP session meanwhile."""
+        VVMAccessApi.acquire_session()
+        try:
+            return await request
+        finally:
+            await VVMAccessApi.async_release_session()
+
+    async def async_step_trip(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Flow to search the origin and destination stops of a connection."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            try:
+                for key in (CONF_ORIGIN, CONF_DESTINATION):
+                    self.trip_stops[key] = await self._async_search_stops(
+                        user_input[key]
+                    )
+                    if not self.trip_stops[key]:
+                        errors[key] = "no_stops_found"
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unexpected exception")
+                errors["base"] = "unknown"
+            if not errors:
+                return await self.async_step_trip_select()
+
+        return self.async_show_form(
+            step_id="trip", data_schema=STEP_TRIP_DATA_SCHEMA, errors=errors
+        )
+
+    async def async_step_trip_select(self, user_input=None):
+        """Handle the step where the user picks the origin and destination."""
+        names = {
+            key: [x["name"] for x in stops] for key, stops in self.trip_stops.items()
+        }
+        schema = vol.Schema(
+            {
+                vol.Required(CONF_ORIGIN): vol.In(names[CONF_ORIGIN]),
+                vol.Required(CONF_DESTINATION): vol.In(names[CONF_DESTINATION]),
+            }
+        )
+
+        if user_input is None:
+            return self.async_show_form(step_id="trip_select", data_schema=schema)
+        ids = {
+            key: next(
+                item["id"]
+                for item in self.trip_stops[key]
+                if item["name"] == user_input[key]
+            )
+            for key in (CONF_ORIGIN, CONF_DESTINATION)
+        }
+        return self.async_create_entry(
+            title=f"{user_input[CONF_ORIGIN]} → {user_input[CONF_DESTINATION]}",
+            data={
+                CONF_ENTRY_TYPE: ENTRY_TYPE_TRIP,
+                CONF_ORIGIN: user_input[CONF_ORIGIN],
+                CONF_ORIGIN_ID: ids[CONF_ORIGIN],
+                CONF_DESTINATION: user_input[CONF_DESTINATION],
+                CONF_DESTINATION_ID: ids[CONF_DESTINATION],
+            },
+        )
+
+    async def async_step_board(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Flow to merge the departures of configured stops into one board."""
+        stops = {
+            entry.entry_id: entry.title
+            for entry in self._async_current_entries()
+            if entry.data.get(CONF_ENTRY_TYPE, ENTRY_TYPE_STOP) == ENTRY_TYPE_STOP
+        }
+        if not stops:
+            return self.async_abort(reason="no_stops")
+
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            if user_input[CONF_STOPS]:
+                return self.async_create_entry(
+                    title=user_input[CONF_NAME],
+                    data={
+                        CONF_ENTRY_TYPE: ENTRY_TYPE_BOARD,
+                        CONF_STOPS: user_input[CONF_STOPS],
+                        CONF_MAX_DEPARTURES: user_input[CONF_MAX_DEPARTURES],
+                    },
+                )
+            errors[CONF_STOPS] = "no_stops_selected"
+
+        schema = vol.Schema(
+            {
+                vol.Required(CONF_NAME, default="Departure Board"): str,
+                vol.Required(CONF_STOPS, default=[]): cv.multi_select(stops),
+                vol.Required(
+                    CONF_MAX_DEPARTURES, default=DEFAULT_BOARD_MAX_DEPARTURES
+                ): cv.positive_int,
+            }
+        )
+        return self.async_show_form(step_id="board", data_schema=schema, errors=errors)
+
     async def async_step_station_select(self, user_input=None):
         """Handle the step where the user inputs his/her station."""
 
@@ -125,15 +277,38 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             for item in self.stops
             if item["name"] == user_input[CONF_STATION]
         ]
-        title = user_input[CONF_STATION]
+        errors: dict[str, str] = {}
+        try:
+            # the response is shared with the first refresh of the new entry
+            info = await self._async_request(
+                validate_input(self.hass, {CONF_STOP_ID: stops[0]})
+            )
+        except InvalidStopId:
+            errors["base"] = "invalid_stop_id"
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Unexpected exception")
+            errors["base"] = "unknown"
+        if errors:
+            return self.async_show_form(
+                step_id="station_select", data_schema=schema, errors=errors
+            )
         return self.async_create_entry(
-            title=title,
+            title=info["title"] or user_input[CONF_STATION],
             data={
-                CONF_STOP_ID: stops[0],
+                CONF_STOP_ID: info["stop_id"],
                 CONF_TIMEFRAME: 15,
             },
         )
 
+    @classmethod
+    @callback
+    def async_supports_options_flow(
+        cls, config_entry: config_entries.ConfigEntry
+    ) -> bool:
+        """Only stops have options, boards and trips are set up at creation."""
+        entry_type = config_entry.data.get(CONF_ENTRY_TYPE, ENTRY_TYPE_STOP)
+        return entry_type == ENTRY_TYPE_STOP
+
     @staticmethod
     @callback
     def async_get_options_flow(
@@ -162,13 +337,22 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 CONF_FILTER_TYPE: user_input[CONF_FILTER_TYPE],
                 CONF_FILTER_NUM: user_input[CONF_FILTER_NUM],
                 CONF_FILTER_DIRECTION: user_input[CONF_FILTER_DIRECTION],
+                CONF_FILTER_PLATFORM: user_input[CONF_FILTER_PLATFORM],
                 CONF_TIMEFRAME: user_input[CONF_TIMEFRAME],
+                CONF_QUIET_HOURS: user_input[CONF_QUIET_HOURS],
+                CONF_ATTRIBUTE_MODE: user_input[CONF_ATTRIBUTE_MODE],
             }
             # init here filters
             vvm.data.filter_types = user_input[CONF_FILTER_TYPE]
             vvm.data.filter_nums = user_input[CONF_FILTER_NUM]
             vvm.data.filter_direction = user_input[CONF_FILTER_DIRECTION]
+            vvm.data.filter_platform = user_input[CONF_FILTER_PLATFORM]
             vvm.data.timespan = user_input[CONF_TIMEFRAME]
+            vvm.data.quiet_hours = user_input[CONF_QUIET_HOURS]
+            vvm.data.attribute_mode = user_input[CONF_ATTRIBUTE_MODE]
+            # publish the changes like the filter entities do
+            hub: VVMPollingHub = self.hass.data[DATA_HUB]
+            await hub.async_request_refilter(self.config_entry.entry_id)
             return self.async_create_entry(title="", data=options)
 
         if CONF_FILTER_TYPE in self.config_entry.options:
@@ -197,6 +381,22 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                             CONF_FILTER_DIRECTION, ""
                         ),
                     ): str,
+                    vol.Optional(
+                        CONF_FILTER_PLATFORM,
+                        default=self.config_entry.options.get(
+                            CONF_FILTER_PLATFORM, ""
+                        ),
+                    ): str,
+                    vol.Optional(
+                        CONF_QUIET_HOURS,
+                        default=self.config_entry.options.get(CONF_QUIET_HOURS, ""),
+                    ): str,
+                    vol.Optional(
+                        CONF_ATTRIBUTE_MODE,
+                        default=self.config_entry.options.get(
+                            CONF_ATTRIBUTE_MODE, ATTRIBUTE_MODE_FULL
+                        ),
+                    ): vol.In(ATTRIBUTE_MODES),
                 }
             ),
             errors=errors,
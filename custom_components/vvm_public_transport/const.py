@@ -1,6 +1,31 @@
 """Constants for the vvm_transport integration."""
+from datetime import timedelta
 
 DOMAIN = "vvm_public_transport"
+DATA_HUB = f"{DOMAIN}_hub"
+DATA_LOOKUP_STORE = f"{DOMAIN}_lookup_store"
+DATA_CATALOG_STORE = f"{DOMAIN}_catalog_store"
+DATA_SNAPSHOTS = f"{DOMAIN}_snapshots"
+DATA_TRIPS = f"{DOMAIN}_trips"
+DATA_DELAY_HISTORY = f"{DOMAIN}_delay_history"
+
+SIGNAL_POLLED = f"{DOMAIN}_polled"
+SIGNAL_STOP_ADDED = f"{DOMAIN}_stop_added"
+SIGNAL_STOP_REMOVED = f"{DOMAIN}_stop_removed"
+SERVICE_IMPORT_STOP_CATALOG = "import_stop_catalog"
+SERVICE_GET_DEPARTURES = "get_departures"
+SERVICE_GET_DELAY_STATISTICS = "get_delay_statistics"
+ATTR_PATH = "path"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_LINE = "line"
+ATTR_DEPARTURES = "departures"
+ATTR_DEPARTURE_FIELDS = "departure_fields"
+
+STORAGE_VERSION = 1
+LOOKUP_CACHE_STORAGE_KEY = f"{DOMAIN}.lookup_cache"
+STOP_CATALOG_STORAGE_KEY = f"{DOMAIN}.stop_catalog"
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.snapshots"
+DELAY_HISTORY_STORAGE_KEY = f"{DOMAIN}.delay_history"
 
 CONF_STATION = "station"
 CONF_STOP_ID = "stop_id"
@@ -8,6 +33,93 @@ CONF_TIMEFRAME = "timeframe"
 CONF_FILTER_DIRECTION = "filter_direction"
 CONF_FILTER_TYPE = "filter_type"
 CONF_FILTER_NUM = "filter_num"
+CONF_FILTER_PLATFORM = "filter_platform"
+CONF_QUIET_HOURS = "quiet_hours"
+CONF_ATTRIBUTE_MODE = "attribute_mode"
+CONF_ENTRY_TYPE = "entry_type"
+CONF_STOPS = "stops"
+CONF_MAX_DEPARTURES = "max_departures"
+CONF_ORIGIN = "origin"
+CONF_ORIGIN_ID = "origin_id"
+CONF_DESTINATION = "destination"
+CONF_DESTINATION_ID = "destination_id"
+
+ENTRY_TYPE_STOP = "stop"
+ENTRY_TYPE_BOARD = "board"
+ENTRY_TYPE_TRIP = "trip"
+DEFAULT_BOARD_MAX_DEPARTURES = 10
+
+ATTRIBUTE_MODE_FULL = "full"
+ATTRIBUTE_MODE_COMPACT = "compact"
+ATTRIBUTE_MODE_NONE = "none"
+ATTRIBUTE_MODES = [ATTRIBUTE_MODE_FULL, ATTRIBUTE_MODE_COMPACT, ATTRIBUTE_MODE_NONE]
+# order of the fields of a departure in the compact attribute mode
+COMPACT_DEPARTURE_FIELDS = ["left", "delay", "type", "num", "to", "real_time_simple"]
+# order of the fields of a departure pushed to websocket subscribers, the
+# realtime is in epoch milliseconds so that the countdown is derived locally
+STREAM_DEPARTURE_FIELDS = [
+    "real_time",
+    "delay",
+    "type",
+    "num",
+    "to",
+    "platform",
+    "real_time_simple",
+]
+
+API_BASE_URL = "https://mobile.defas-fgi.de/vvmapp"
+# settings of the HTTP session shared by all entries
+DEFAULT_LIMIT_PER_HOST = 4
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_REQUEST_TIMEOUT = 20
+MAX_RETRIES = 2
+RETRY_BASE_DELAY = 1.0
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MAX_TOKENS = 10
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_BASE_BACKOFF = 30.0
+BREAKER_MAX_BACKOFF = 1800.0
+REQUEST_RATE_LIMIT = 2.0
+REQUEST_BURST = 4
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_POLL_INTERVAL = timedelta(minutes=1)
+MIN_POLL_INTERVAL = timedelta(seconds=30)
+POLL_STAGGER_PERIOD = timedelta(seconds=30)
+MAX_POLL_INTERVAL = timedelta(minutes=10)
+QUIET_POLL_INTERVAL = timedelta(minutes=30)
+FILTER_REFRESH_COOLDOWN = 0.5
+IMMINENT_DEPARTURE_MINUTES = 3
+PARSE_REUSE_MINUTES = 10
+DM_MIN_LIMIT = 10
+DM_RESPONSE_TTL = timedelta(seconds=20)
+DM_LIMIT_HEADROOM = 1.5
+DEFAULT_TRIP_COUNT = 4
+TRIP_POLL_INTERVAL = timedelta(minutes=1)
+TRIP_TIME_BUCKET = timedelta(minutes=15)
+TRIP_CACHE_TTL = timedelta(minutes=30)
+TRIP_CACHE_MAX_ENTRIES = 32
+TRIP_WATCH_MINUTES = 60
+LOOKUP_CACHE_MAX_ENTRIES = 256
+LOOKUP_CACHE_TTL = timedelta(days=7)
+LOOKUP_CACHE_SAVE_DELAY = 30
+SNAPSHOT_SAVE_DELAY = 60
+DELAY_HISTORY_SAVE_DELAY = 600
+DELAY_HISTORY_SIZE = 512
+DELAY_HISTOGRAM_MIN = -10
+DELAY_HISTOGRAM_MAX = 120
+ON_TIME_DELAY_MINUTES = 1
+NEARBY_RADIUS = 500
+STOPFINDER_MAX_RESULTS = 50
+NEARBY_MAX_RESULTS = 10
+NEARBY_FETCH_MAX_RESULTS = 100
+CATALOG_GRID_CELL = 0.01
+CATALOG_MAX_COVERED_AREAS = 64
+CATALOG_MAX_SEARCHED_KEYWORDS = 256
+LATENCY_BUCKETS_MS = (
+    10, 25, 50, 75, 100, 150, 200, 300, 400, 500, 750,
+    1000, 1500, 2000, 3000, 5000, 10000, 20000,
+)  # fmt: skip
 
 V_TYPE_TRAM = "Straßenbahn"
 V_TYPE_BUS = "Bus"
@@ -26,3 +138,13 @@ V_TYPE_LIST = [
     V_TYPE_S_BAHN,
     V_TYPE_U_BAHN,
 ]
+
+# EFA means of transport (motType) of the vehicle types, completed at runtime
+# with the ones seen in the departure monitor responses
+V_TYPE_MEANS = {
+    V_TYPE_S_BAHN: ("1",),
+    V_TYPE_U_BAHN: ("2",),
+    V_TYPE_TRAM: ("4",),
+    V_TYPE_BUS: ("5",),
+    V_TYPE_REGIONAL_BUS: ("6",),
+}
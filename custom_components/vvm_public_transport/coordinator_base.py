@@ -1,19 +1,24 @@
 """VVM Stop departure monitor base coordinator class for entities."""
 
+from homeassistant.core import callback
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
 )
 
-from .const import DOMAIN
+from .const import DATA_HUB, DOMAIN
 from .vvm_access import VVMStopMonitorHA
 
 
 class VVMStopCoordinatorEntityBase(
     CoordinatorEntity[DataUpdateCoordinator[VVMStopMonitorHA]]
 ):
-    """Base functionality for all VVM entities."""
+    """Base functionality for all VVM entities.
+
+    On coordinator updates the state is only written if the availability, the
+    state or the attributes differ from the last written ones.
+    """
 
     _attr_has_entity_name = True
 
@@ -29,8 +34,33 @@ class VVMStopCoordinatorEntityBase(
             manufacturer="VVM",
         )
         self._name = f"{coordinator.data.stop_name} {entity_id}"
+        self._last_written = None
 
     @property
     def name(self):
         """Return the name of the sensor."""
         return self._name
+
+    @callback
+    def async_write_ha_state_if_changed(self) -> None:
+        """Write the state unless it equals the last written one."""
+        attributes = self.extra_state_attributes
+        written = (
+            self.available,
+            self.state,
+            dict(attributes) if attributes is not None else None,
+        )
+        if written == self._last_written:
+            return
+        self._last_written = written
+        self.async_write_ha_state()
+
+    async def async_apply_filters(self) -> None:
+        """Publish the departures for the changed filters, re-filtered locally."""
+        hub = self.hass.data[DATA_HUB]
+        await hub.async_request_refilter(self.platform.config_entry.entry_id)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        self.async_write_ha_state_if_changed()
@@ -0,0 +1,77 @@
+"""Incremental changes of the departures of a stop, keyed by trip."""
+from __future__ import annotations
+
+from .departure import Departure
+
+
+def departure_key(d: Departure) -> str:
+    """Return the key of a departure, its trip if known."""
+    if d.trip:
+        return d.trip
+    return f"{d.num}|{d.to}|{d.should_time:%Y%m%d%H%M}"
+
+
+def stream_row(d: Departure) -> tuple:
+    """Return the fields pushed to subscribers, see STREAM_DEPARTURE_FIELDS."""
+    return (
+        int(d.real_time.timestamp() * 1000),
+        d.delay,
+        d.type,
+        d.num,
+        d.to,
+        d.platform,
+        d.real_time_simple,
+    )
+
+
+class DepartureDeltas:
+    """Differences between the successive departure lists of a stop.
+
+    The rows carry the realtime instead of the countdown, so the countdowns
+    advancing every minute do not produce a delta; only departures that are
+    added, removed, delayed or reordered do.
+    """
+
+    def __init__(self) -> None:
+        """Construct the tracker with nothing sent yet."""
+        self._source = None
+        self._rows: dict[str, tuple] = {}
+        self._order: list[str] = []
+
+    def _rows_of(self, departures) -> dict[str, tuple]:
+        """Return the rows of the departures in order, with unique keys."""
+        rows: dict[str, tuple] = {}
+        for d in departures:
+            key = departure_key(d)
+            while key in rows:
+                key += "'"
+            rows[key] = stream_row(d)
+        return rows
+
+    def reset(self, departures) -> dict:
+        """Return all departures, to start a subscription."""
+        self._source = departures
+        self._rows = self._rows_of(departures)
+        self._order = list(self._rows)
+        return {"reset": True, "upsert": dict(self._rows), "order": self._order}
+
+    def update(self, departures) -> dict | None:
+        """Return the changes since the last call, None if there are none."""
+        if departures is self._source:
+            return None
+        self._source = departures
+        rows = self._rows_of(departures)
+        old = self._rows
+        upsert = {k: row for k, row in rows.items() if old.get(k) != row}
+        remove = [k for k in old if k not in rows]
+        order = list(rows)
+        self._rows = rows
+        delta: dict = {}
+        if upsert:
+            delta["upsert"] = upsert
+        if remove:
+            delta["remove"] = remove
+        if order != self._order:
+            delta["order"] = order
+            self._order = order
+        return delta or None
@@ -0,0 +1,168 @@
+"""Departure record of the VVM departure monitor."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import sys
+
+
+def minutes_between(earlier: datetime, later: datetime) -> int:
+    """Return the number of minute boundaries crossed between two moments."""
+    earlier = earlier.replace(second=0, microsecond=0)
+    later = later.replace(second=0, microsecond=0)
+    return int((later - earlier) // timedelta(minutes=1))
+
+
+def minutes_until(moment: datetime, now: datetime | None = None) -> int:
+    """Return the number of minutes from now until a departure time."""
+    return minutes_between(datetime.now() if now is None else now, moment)
+
+
+def parse_efa_datetime(dt: dict, cache: dict) -> datetime:
+    """Convert an EFA date/time dict, reusing instances already in the cache."""
+    key = (dt["year"], dt["month"], dt["day"], dt["hour"], dt["minute"])
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = datetime(
+            int(key[0]), int(key[1]), int(key[2]), int(key[3]), int(key[4])
+        )
+    return value
+
+
+class Departure:
+    """A single departure from a stop."""
+
+    __slots__ = (
+        "left",
+        "delay",
+        "type",
+        "num",
+        "to",
+        "origin",
+        "platform",
+        "should_time",
+        "real_time",
+        "trip",
+    )
+
+    left: int
+    delay: int
+    type: str
+    num: str
+    to: str
+    origin: str
+    platform: str
+    should_time: datetime
+    real_time: datetime
+    trip: str
+
+    def __init__(
+        self,
+        left,
+        delay,
+        vehicle_type,
+        num,
+        to,
+        origin,
+        platform,
+        should_time,
+        real_time,
+        trip="",
+    ) -> None:
+        """Construct the departure, interning the often repeated strings.
+
+        The trip identifies the vehicle run, so the same departure can be
+        recognized at neighbouring stops; it is empty if unknown.
+        """
+        self.left = left
+        self.delay = delay
+        self.type = sys.intern(vehicle_type)
+        self.num = sys.intern(num)
+        self.to = sys.intern(to)
+        self.origin = sys.intern(origin)
+        self.platform = sys.intern(platform)
+        self.should_time = should_time
+        self.real_time = real_time
+        self.trip = trip
+
+    @property
+    def should_time_simple(self) -> str:
+        """Scheduled departure time as HH:MM."""
+        return f"{self.should_time.hour:02d}:{self.should_time.minute:02d}"
+
+    @property
+    def real_time_simple(self) -> str:
+        """Realtime departure time as HH:MM."""
+        return f"{self.real_time.hour:02d}:{self.real_time.minute:02d}"
+
+    def with_left(self, left: int) -> Departure:
+        """Return a copy of the departure with a different countdown."""
+        d = Departure.__new__(Departure)
+        for attr in Departure.__slots__:
+            setattr(d, attr, getattr(self, attr))
+        d.left = left
+        return d
+
+    def as_compact(self) -> list:
+        """Return the departure as a compact list, without the countdown."""
+        return [
+            self.delay,
+            self.type,
+            self.num,
+            self.to,
+            self.origin,
+            self.platform,
+            self.should_time.isoformat(timespec="minutes"),
+            self.real_time.isoformat(timespec="minutes"),
+            self.trip,
+        ]
+
+    @staticmethod
+    def from_compact(data: list, left: int | None = None) -> Departure:
+        """Construct a departure from the as_compact form.
+
+        Without an explicit countdown, it is derived from the current time.
+        """
+        delay, vehicle_type, num, to, origin, platform, should, real, *rest = data
+        real_time = datetime.fromisoformat(real)
+        if left is None:
+            left = minutes_until(real_time)
+        return Departure(
+            left,
+            delay,
+            vehicle_type,
+            num,
+            to,
+            origin,
+            platform,
+            datetime.fromisoformat(should),
+            real_time,
+            rest[0] if rest else "",
+        )
+
+    def as_row(self) -> tuple:
+        """Return the fields shown by the card, see COMPACT_DEPARTURE_FIELDS."""
+        return (
+            self.left,
+            self.delay,
+            self.type,
+            self.num,
+            self.to,
+            self.real_time_simple,
+        )
+
+    def as_dict(self) -> dict:
+        """Return the departure in the form published as entity attribute."""
+        return {
+            "left": self.left,
+            "delay": self.delay,
+            "type": self.type,
+            "num": self.num,
+            "to": self.to,
+            "from": self.origin,
+            "platform": self.platform,
+            "should_time": self.should_time,
+            "should_time_simple": self.should_time_simple,
+            "real_time": self.real_time,
+            "real_time_simple": self.real_time_simple,
+            "trip": self.trip,
+        }
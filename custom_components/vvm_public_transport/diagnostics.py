@@ -0,0 +1,88 @@
+"""Diagnostics support for VVM Transport."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .board import DepartureBoard
+from .const import (
+    CONF_ENTRY_TYPE,
+    CONF_MAX_DEPARTURES,
+    CONF_STOPS,
+    DATA_HUB,
+    DATA_TRIPS,
+    DOMAIN,
+    ENTRY_TYPE_BOARD,
+    ENTRY_TYPE_TRIP,
+)
+from .vvm_access import VVMAccessApi, VVMStopMonitorHA
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics of a config entry."""
+    entry_data = {"data": dict(entry.data), "options": dict(entry.options)}
+    if entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_TRIP:
+        coordinator = hass.data.get(DATA_TRIPS, {}).get(entry.entry_id)
+        if coordinator is None:
+            return {"entry": entry_data, "unloaded": True}
+        return {
+            "entry": entry_data,
+            "trip": coordinator.data.diagnostics(),
+            "api_metrics": VVMAccessApi.metrics.as_dict(),
+            "breakers": VVMAccessApi.breaker_states(),
+        }
+    if entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_BOARD:
+        return {"entry": entry_data, "board": _board_diagnostics(hass, entry)}
+    coordinator = hass.data.get(DOMAIN, {}).get(entry.entry_id)
+    if coordinator is None:
+        return {"entry": entry_data, "unloaded": True}
+    monitor: VVMStopMonitorHA = coordinator.data
+    hub = hass.data[DATA_HUB]
+    return {
+        "entry": entry_data,
+        "monitor": {
+            "stop_id": monitor.stop_id,
+            "timespan": monitor.timespan,
+            "stale": monitor.stale,
+            "last_error": monitor.last_error,
+            "last_updated": monitor.last_updated.isoformat()
+            if monitor.last_updated is not None
+            else None,
+            "departures": len(monitor.departures),
+        },
+        "schedule": hub.diagnostics(entry.entry_id),
+        "stop_metrics": monitor.api.metrics.as_dict(),
+        "api_metrics": VVMAccessApi.metrics.as_dict(),
+        "breakers": VVMAccessApi.breaker_states(),
+        "lookup_cache": VVMAccessApi.lookup_cache.stats(),
+        "stop_catalog": VVMAccessApi.stop_catalog.stats(),
+        "departure_cache": VVMAccessApi.departure_cache.stats(),
+    }
+
+
+def _board_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the member stops of a board and the board merged from them."""
+    coordinators = hass.data.get(DOMAIN, {})
+    board = DepartureBoard(entry.data[CONF_MAX_DEPARTURES])
+    stops = {}
+    for entry_id in entry.data[CONF_STOPS]:
+        if (coordinator := coordinators.get(entry_id)) is None:
+            stops[entry_id] = {"loaded": False}
+            continue
+        monitor: VVMStopMonitorHA = coordinator.data
+        board.update_stop(entry_id, monitor.stop_name, monitor.departures)
+        stops[entry_id] = {
+            "loaded": True,
+            "stop_id": monitor.stop_id,
+            "stale": monitor.stale,
+            "departures": len(monitor.departures),
+        }
+    return {
+        "max_departures": board.max_departures,
+        "stops": stops,
+        "merged_departures": len(board.departures),
+    }
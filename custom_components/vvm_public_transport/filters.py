@@ -0,0 +1,125 @@
+"""Compiled departure filters for the VVM departure monitor.
+
+Filter values are compiled once into sets and regular expressions so that
+checking a departure does not depend on the number of filter values.
+
+Syntax of the number, direction and platform filter values:
+    5       include line 5 (direction: destinations containing the text)
+    !5      exclude line 5
+    1-6     include the numeric lines 1 to 6 (numbers only)
+    !1-6    exclude the numeric lines 1 to 6 (numbers only)
+"""
+from __future__ import annotations
+
+import re
+
+from .departure import Departure
+
+
+def _split_exclusions(values) -> tuple[list[str], list[str]]:
+    """Split filter values into included and excluded ones, lowercased."""
+    include = []
+    exclude = []
+    for v in values:
+        v = v.strip().lower()
+        if v.startswith("!"):
+            v = v[1:].strip()
+            if v:
+                exclude.append(v)
+        elif v:
+            include.append(v)
+    return include, exclude
+
+
+def _compile_numbers(values) -> tuple[frozenset[str], tuple[range, ...]]:
+    """Compile line numbers into a set of exact matches and numeric ranges."""
+    exact = set()
+    ranges = []
+    for v in values:
+        lo, sep, hi = v.partition("-")
+        if sep and lo.strip().isdigit() and hi.strip().isdigit():
+            ranges.append(range(int(lo), int(hi) + 1))
+        else:
+            exact.add(v)
+    return frozenset(exact), tuple(ranges)
+
+
+def _compile_substrings(values) -> re.Pattern | None:
+    """Compile substrings into a single case-insensitive alternation."""
+    if not values:
+        return None
+    return re.compile("|".join(re.escape(v) for v in values), re.IGNORECASE)
+
+
+def means_params(types, known_means) -> dict[str, str]:
+    """Translate a type filter into EFA parameters including only its means.
+
+    Returns no parameters, i.e. all means of transport, unless the means of
+    every filtered type are known.
+    """
+    if not types:
+        return {}
+    means: set[str] = set()
+    for t in types:
+        if not (m := known_means.get(t)):
+            return {}
+        means.update(m)
+    return {"includedMeans": "checkbox", **{f"inclMOT_{m}": "1" for m in sorted(means)}}
+
+
+def _num_matches(num: str, exact: frozenset[str], ranges: tuple[range, ...]) -> bool:
+    """Check a lowercased line number against exact values and ranges."""
+    if num in exact:
+        return True
+    if ranges and num.isdigit():
+        n = int(num)
+        return any(n in r for r in ranges)
+    return False
+
+
+class DepartureFilter:
+    """Filter compiled from the type, number, direction and platform filters."""
+
+    def __init__(self, types=(), numbers=(), directions=(), platforms=()) -> None:
+        """Compile the filter values."""
+        self._types = frozenset(types)
+
+        include, exclude = _split_exclusions(numbers)
+        self._nums_in, self._ranges_in = _compile_numbers(include)
+        self._nums_out, self._ranges_out = _compile_numbers(exclude)
+        self._has_nums_in = bool(include)
+        self._has_nums_out = bool(exclude)
+
+        include, exclude = _split_exclusions(directions)
+        self._dir_in = _compile_substrings(include)
+        self._dir_out = _compile_substrings(exclude)
+
+        include, exclude = _split_exclusions(platforms)
+        self._platforms_in = frozenset(include)
+        self._platforms_out = frozenset(exclude)
+
+    def matches(self, d: Departure) -> bool:
+        """Check if the departure passes the filter."""
+        if self._types and d.type not in self._types:
+            return False
+        if self._has_nums_in or self._has_nums_out:
+            num = d.num.lower()
+            if self._has_nums_in and not _num_matches(
+                num, self._nums_in, self._ranges_in
+            ):
+                return False
+            if self._has_nums_out and _num_matches(
+                num, self._nums_out, self._ranges_out
+            ):
+                return False
+        if self._dir_in is not None and self._dir_in.search(d.to) is None:
+            return False
+        if self._dir_out is not None and self._dir_out.search(d.to) is not None:
+            return False
+        if self._platforms_in or self._platforms_out:
+            platform = d.platform.lower()
+            if self._platforms_in and platform not in self._platforms_in:
+                return False
+            if platform in self._platforms_out:
+                return False
+        return True
@@ -0,0 +1,170 @@
+"""Long-term delay statistics of the lines of a stop."""
+from __future__ import annotations
+
+from array import array
+import base64
+from datetime import datetime, timedelta
+import sys
+
+from .const import (
+    DELAY_HISTOGRAM_MAX,
+    DELAY_HISTOGRAM_MIN,
+    DELAY_HISTORY_SIZE,
+    ON_TIME_DELAY_MINUTES,
+)
+from .deltas import departure_key
+
+_BUCKETS = DELAY_HISTOGRAM_MAX - DELAY_HISTOGRAM_MIN + 1
+# a departure that vanishes from the list this close to its time has left
+_DEPARTED_SLACK = timedelta(minutes=1)
+
+
+def _delays_stats(counts, count: int, total: int) -> dict:
+    """Summarize a histogram of delays in minutes."""
+    if not count:
+        return {"count": 0, "mean": None, "p50": None, "p90": None, "on_time": None}
+
+    def percentile(p):
+        target = count * p / 100
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target:
+                return i + DELAY_HISTOGRAM_MIN
+        return DELAY_HISTOGRAM_MAX
+
+    on_time = sum(counts[: ON_TIME_DELAY_MINUTES - DELAY_HISTOGRAM_MIN + 1])
+    return {
+        "count": count,
+        "mean": round(total / count, 2),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "on_time": round(100 * on_time / count, 1),
+    }
+
+
+class DelayRing:
+    """The last delays of a line in a fixed size ring buffer.
+
+    A histogram of the delays in the buffer is kept up to date on every
+    insertion, so the statistics never need to scan the buffer. Delays are
+    clamped to the range of the histogram.
+    """
+
+    __slots__ = ("_values", "_head", "count", "counts", "total")
+
+    def __init__(self, size=DELAY_HISTORY_SIZE) -> None:
+        """Construct an empty ring."""
+        self._values = array("h", bytes(2 * size))
+        self._head = 0
+        self.count = 0
+        self.counts = array("I", bytes(4 * _BUCKETS))
+        self.total = 0
+
+    def record(self, delay: int) -> None:
+        """Add a delay, replacing the oldest one if the ring is full."""
+        delay = min(max(delay, DELAY_HISTOGRAM_MIN), DELAY_HISTOGRAM_MAX)
+        if self.count == len(self._values):
+            old = self._values[self._head]
+            self.counts[old - DELAY_HISTOGRAM_MIN] -= 1
+            self.total -= old
+        else:
+            self.count += 1
+        self._values[self._head] = delay
+        self._head = (self._head + 1) % len(self._values)
+        self.counts[delay - DELAY_HISTOGRAM_MIN] += 1
+        self.total += delay
+
+    def stats(self) -> dict:
+        """Return the statistics of the delays in the ring."""
+        return _delays_stats(self.counts, self.count, self.total)
+
+    def as_stored(self) -> str:
+        """Return the delays, oldest first, as base64 of little-endian shorts."""
+        size = len(self._values)
+        start = (self._head - self.count) % size
+        values = array(
+            "h", (self._values[(start + i) % size] for i in range(self.count))
+        )
+        if sys.byteorder != "little":
+            values.byteswap()
+        return base64.b64encode(values.tobytes()).decode()
+
+    @classmethod
+    def from_stored(cls, data: str, size=DELAY_HISTORY_SIZE) -> DelayRing:
+        """Construct a ring from the as_stored form."""
+        values = array("h")
+        values.frombytes(base64.b64decode(data))
+        if sys.byteorder != "little":
+            values.byteswap()
+        ring = cls(size)
+        for delay in values[-size:]:
+            ring.record(delay)
+        return ring
+
+
+class StopDelayHistory:
+    """Delay history of the lines of a stop.
+
+    Every trip is recorded once, with its last known delay, when it leaves
+    the departure list around its departure time. Trips that vanish long
+    before, e.g. because the timeframe changed, are not recorded.
+    """
+
+    def __init__(self) -> None:
+        """Construct an empty history."""
+        self.lines: dict[str, DelayRing] = {}
+        self.version = 0
+        self.dirty = False
+        self._source = None
+        self._pending: dict[str, tuple[str, int, datetime]] = {}
+        self._stats_version = -1
+        self._stats: dict = {}
+
+    def observe(self, departures, now: datetime) -> bool:
+        """Take the current departures, returning True if any trip was recorded."""
+        if departures is self._source:
+            return False
+        self._source = departures
+        current = {
+            departure_key(d): (f"{d.type} {d.num}", d.delay, d.real_time)
+            for d in departures
+        }
+        recorded = False
+        for key, (line, delay, real_time) in self._pending.items():
+            if key not in current and real_time <= now + _DEPARTED_SLACK:
+                if (ring := self.lines.get(line)) is None:
+                    ring = self.lines[line] = DelayRing()
+                ring.record(delay)
+                recorded = True
+        self._pending = current
+        if recorded:
+            self.version += 1
+            self.dirty = True
+        return recorded
+
+    def stats(self) -> dict:
+        """Return the statistics of the whole stop and by line."""
+        if self._stats_version != self.version:
+            counts = [0] * _BUCKETS
+            count = total = 0
+            for ring in self.lines.values():
+                counts = [a + b for a, b in zip(counts, ring.counts)]
+                count += ring.count
+                total += ring.total
+            self._stats = {
+                **_delays_stats(counts, count, total),
+                "lines": {line: ring.stats() for line, ring in self.lines.items()},
+            }
+            self._stats_version = self.version
+        return self._stats
+
+    def as_dict(self) -> dict:
+        """Return the history in a serializable form."""
+        self.dirty = False
+        return {line: ring.as_stored() for line, ring in self.lines.items()}
+
+    def load(self, data: dict) -> None:
+        """Load the history from the as_dict form."""
+        self.lines = {line: DelayRing.from_stored(d) for line, d in data.items()}
+        self.version += 1
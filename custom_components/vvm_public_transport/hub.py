@@ -0,0 +1,285 @@
+"""Central polling hub for all VVM stop monitors."""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import math
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later, async_track_time_change
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_POLL_INTERVAL,
+    FILTER_REFRESH_COOLDOWN,
+    MAX_POLL_INTERVAL,
+    POLL_STAGGER_PERIOD,
+    SIGNAL_POLLED,
+)
+from .scheduler import VVMAdaptiveScheduler
+from .departure import Departure
+from .vvm_access import VVMStopMonitor, VVMStopMonitorHA
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class VVMPollingHub:
+    """Own all stop monitors and poll them with bounded concurrency.
+
+    Every stop gets a fixed phase within the stagger period, spreading the
+    stops evenly over it, and its polls are aligned to the slots of that
+    phase closest to what its adaptive schedule asks for. A single timer
+    wakes the hub up for the earliest scheduled poll. Every minute the
+    countdowns of all monitors are recomputed locally, so polls are only
+    needed to pick up realtime changes. Filter changes are applied locally
+    too, unless the departures they need were never fetched. The hub also
+    provides the departures the connections check for delays.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+        stagger_period=POLL_STAGGER_PERIOD,
+    ) -> None:
+        """Construct the polling hub."""
+        self.hass = hass
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._stagger_period = stagger_period
+        self._monitors: dict[str, VVMStopMonitorHA] = {}
+        self._schedulers: dict[str, VVMAdaptiveScheduler] = {}
+        self._next_poll: dict[str, datetime] = {}
+        self._offsets: dict[str, float] = {}
+        self._coordinators: dict[str, DataUpdateCoordinator[VVMStopMonitorHA]] = {}
+        self._polling: set[str] = set()
+        self._refilters: dict[str, Debouncer] = {}
+        self._watched: dict[str, tuple[VVMStopMonitor, datetime]] = {}
+        self._unsub_timer = None
+        self._unsub_ticker = None
+
+    def async_add_monitor(
+        self, entry_id: str, monitor: VVMStopMonitorHA
+    ) -> DataUpdateCoordinator[VVMStopMonitorHA]:
+        """Register a monitor and return the coordinator its entities use."""
+
+        async def async_update_data() -> VVMStopMonitorHA:
+            """Fetch data from the API."""
+            await self.async_fetch(entry_id)
+            return monitor
+
+        coordinator = DataUpdateCoordinator(
+            self.hass,
+            _LOGGER,
+            name="vvm_public_transport_stop",
+            update_method=async_update_data,
+        )
+        self._monitors[entry_id] = monitor
+        monitor.api.attach()
+        self._coordinators[entry_id] = coordinator
+        self._schedulers[entry_id] = VVMAdaptiveScheduler()
+        self._update_offsets()
+        self._next_poll[entry_id] = self._next_slot(entry_id, datetime.now())
+        if self._unsub_ticker is None:
+            self._unsub_ticker = async_track_time_change(
+                self.hass, self._async_refresh_countdowns, second=0
+            )
+        self._async_schedule_wakeup()
+        return coordinator
+
+    def async_remove_monitor(self, entry_id: str) -> None:
+        """Stop polling the monitor of a config entry."""
+        if (monitor := self._monitors.pop(entry_id, None)) is not None:
+            monitor.api.detach()
+        self._coordinators.pop(entry_id, None)
+        self._schedulers.pop(entry_id, None)
+        self._next_poll.pop(entry_id, None)
+        if (debouncer := self._refilters.pop(entry_id, None)) is not None:
+            debouncer.async_cancel()
+        self._update_offsets()
+        self._async_schedule_wakeup()
+
+    def diagnostics(self, entry_id: str) -> dict:
+        """Return the scheduling state of an entry."""
+        next_poll = self._next_poll.get(entry_id)
+        return {
+            "phase_offset_s": self._offsets.get(entry_id),
+            "next_poll": next_poll.isoformat() if next_poll is not None else None,
+            "polling": entry_id in self._polling,
+            "monitors": len(self._monitors),
+        }
+
+    def _update_offsets(self) -> None:
+        """Spread the stops evenly over the stagger period.
+
+        The phases only depend on the set of configured stop ids, so they stay
+        the same across restarts. Entries of the same stop share a phase, which
+        lets their requests be coalesced.
+        """
+        stop_ids = sorted({m.stop_id for m in self._monitors.values()})
+        step = self._stagger_period.total_seconds() / max(len(stop_ids), 1)
+        phases = {stop_id: i * step for i, stop_id in enumerate(stop_ids)}
+        self._offsets = {
+            entry_id: phases[m.stop_id] for entry_id, m in self._monitors.items()
+        }
+
+    def _next_slot(self, entry_id: str, earliest: datetime) -> datetime:
+        """Return the first slot of the entry's phase at or after earliest."""
+        period = self._stagger_period.total_seconds()
+        offset = self._offsets.get(entry_id, 0.0)
+        slot = math.ceil((earliest.timestamp() - offset) / period) * period
+        return datetime.fromtimestamp(slot + offset)
+
+    @callback
+    def _async_schedule_wakeup(self) -> None:
+        """Arm the timer for the earliest poll that is not running yet."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        pending = [
+            t
+            for entry_id, t in self._next_poll.items()
+            if entry_id not in self._polling
+        ]
+        if not pending:
+            return
+        delay = (min(pending) - datetime.now()).total_seconds()
+        self._unsub_timer = async_call_later(
+            self.hass, max(delay, 0), self._async_poll_all
+        )
+
+    async def async_fetch(self, entry_id: str) -> bool:
+        """Update a monitor while holding one of the request slots.
+
+        Returns False if the monitor reported no change in its data.
+        """
+        monitor = self._monitors[entry_id]
+        wanted = None
+        try:
+            async with self._semaphore:
+                changed = await monitor.async_update()
+            async_dispatcher_send(self.hass, f"{SIGNAL_POLLED}_{entry_id}")
+            if (scheduler := self._schedulers.get(entry_id)) is not None:
+                now = datetime.now()
+                wanted = now + scheduler.next_interval(monitor, now)
+        finally:
+            if entry_id in self._schedulers:
+                if wanted is None:
+                    # back off from an unexpected error as from a failed request
+                    wanted = datetime.now() + DEFAULT_POLL_INTERVAL
+                # use the slot closest to the wanted time, at least half a period away
+                self._next_poll[entry_id] = self._next_slot(
+                    entry_id, wanted - self._stagger_period / 2
+                )
+                self._async_schedule_wakeup()
+        return changed
+
+    async def async_request_refilter(self, entry_id: str) -> None:
+        """Apply changed filters of a monitor, debouncing successive changes."""
+        if (debouncer := self._refilters.get(entry_id)) is None:
+
+            async def async_refilter() -> None:
+                """Re-filter the departures, fetching them only if needed."""
+                monitor = self._monitors.get(entry_id)
+                coordinator = self._coordinators.get(entry_id)
+                if monitor is None or coordinator is None:
+                    return
+                if entry_id in self._polling or monitor.refilter() is None:
+                    await coordinator.async_request_refresh()
+                else:
+                    # the filter entities change state even if the departures
+                    # stay the same
+                    coordinator.async_set_updated_data(monitor)
+
+            debouncer = self._refilters[entry_id] = Debouncer(
+                self.hass,
+                _LOGGER,
+                cooldown=FILTER_REFRESH_COOLDOWN,
+                immediate=False,
+                function=async_refilter,
+            )
+        await debouncer.async_call()
+
+    async def async_departures(
+        self, stop_id, timespan, first_left
+    ) -> list[Departure]:
+        """Return the departures of a stop for the delay checks of connections.
+
+        The departures of a polled stop are reused. Other stops are requested
+        with one of the request slots, and like the adaptive schedule does,
+        the sooner the first departure of interest, first_left minutes away,
+        the more often.
+        """
+        now = datetime.now()
+        for monitor in self._monitors.values():
+            if monitor.stop_id == stop_id and monitor.api.has_departures:
+                return monitor.api.departures_at(now, timespan)
+        # forget the stops no connection asked for in a while
+        for key, (_, due) in list(self._watched.items()):
+            if now - due > MAX_POLL_INTERVAL:
+                del self._watched[key]
+        stop, due = self._watched.get(stop_id, (None, now))
+        if stop is None:
+            stop = VVMStopMonitor(stop_id)
+        if due <= now or not stop.has_departures:
+            interval = timedelta(minutes=first_left / 2)
+            due = now + max(DEFAULT_POLL_INTERVAL, min(MAX_POLL_INTERVAL, interval))
+            self._watched[stop_id] = (stop, due)
+            async with self._semaphore:
+                return await stop.get_stop_departures(timespan)
+        return stop.departures_at(now, timespan)
+
+    async def _async_poll_all(self, now=None) -> None:
+        """Poll every registered monitor that is due."""
+        self._unsub_timer = None
+        now = datetime.now()
+        due = [
+            entry_id
+            for entry_id in self._monitors
+            if entry_id not in self._polling
+            and self._next_poll.get(entry_id, now) <= now
+        ]
+        self._polling.update(due)
+        self._async_schedule_wakeup()
+        await asyncio.gather(*(self._async_poll(entry_id) for entry_id in due))
+
+    async def _async_poll(self, entry_id: str) -> None:
+        """Poll a single monitor and publish the result to its coordinator."""
+        try:
+            monitor = self._monitors[entry_id]
+            changed = await self.async_fetch(entry_id)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Unexpected error polling stop of entry %s", entry_id)
+            return
+        finally:
+            self._polling.discard(entry_id)
+            self._async_schedule_wakeup()
+
+        if changed and (coordinator := self._coordinators.get(entry_id)) is not None:
+            coordinator.async_set_updated_data(monitor)
+
+    @callback
+    def _async_refresh_countdowns(self, now=None) -> None:
+        """Recompute the countdowns of all monitors that are not being polled."""
+        now = datetime.now()
+        for entry_id, monitor in self._monitors.items():
+            if entry_id in self._polling or not monitor.refresh_countdowns(now):
+                continue
+            if (coordinator := self._coordinators.get(entry_id)) is not None:
+                coordinator.async_set_updated_data(monitor)
+
+    async def async_shutdown(self) -> None:
+        """Stop polling."""
+        for debouncer in self._refilters.values():
+            debouncer.async_cancel()
+        self._refilters.clear()
+        self._watched.clear()
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+        if self._unsub_ticker is not None:
+            self._unsub_ticker()
+            self._unsub_ticker = None
@@ -0,0 +1,127 @@
+"""Bounded LRU cache with a TTL for stop-finder and nearby-stop lookups."""
+from __future__ import annotations
+
+from collections import OrderedDict
+import time
+
+from .const import LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL
+from .metrics import rate
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Normalize a search keyword for use as a cache key."""
+    return " ".join(keyword.lower().split())
+
+
+def name_key(keyword: str) -> str:
+    """Build the cache key of a stop-finder lookup."""
+    return f"name:{normalize_keyword(keyword)}"
+
+
+def coord_key(lat, lon, radius, max_results) -> str:
+    """Build the cache key of a nearby-stop lookup, rounding to about 100m."""
+    return f"coord:{float(lat):.3f}:{float(lon):.3f}:{int(radius)}:{max_results}"
+
+
+class LookupCache:
+    """LRU cache of lookup results whose entries expire after a TTL.
+
+    Expired entries are kept until they are evicted, so that they can still
+    be served while the upstream service is unavailable. Entries are marked
+    complete if the result was not cut off by the service.
+    """
+
+    def __init__(
+        self,
+        max_entries=LOOKUP_CACHE_MAX_ENTRIES,
+        ttl=LOOKUP_CACHE_TTL.total_seconds(),
+    ) -> None:
+        """Construct an empty cache."""
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, list, bool]] = OrderedDict()
+        self.dirty = False
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, allow_expired=False) -> list | None:
+        """Return the cached result for the key, if there is a usable one."""
+        entry = self._entries.get(key)
+        if entry is None or (
+            not allow_expired and time.time() - entry[0] > self._ttl
+        ):
+            if not allow_expired:
+                self.misses += 1
+            return None
+        if not allow_expired:
+            self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, value: list, complete=False) -> None:
+        """Store a result, evicting the least recently used ones if needed."""
+        self._entries[key] = (time.time(), value, complete)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        self.dirty = True
+
+    def find_by_prefix(self, keyword: str) -> list | None:
+        """Answer a name lookup from the result of an earlier, shorter keyword.
+
+        The longest cached keyword that is a prefix of the given one is used and
+        its stops are narrowed down to the ones containing every search word.
+        Only complete results are used, a result cut off by the service may
+        miss stops of the longer keyword.
+        """
+        keyword = normalize_keyword(keyword)
+        words = keyword.split()
+        now = time.time()
+        best = None
+        for key, (stamp, value, complete) in self._entries.items():
+            if not key.startswith("name:") or not complete or now - stamp > self._ttl:
+                continue
+            prefix = key[5:]
+            if prefix and keyword.startswith(prefix):
+                if best is None or len(prefix) > len(best[0]):
+                    best = (prefix, value)
+        if best is None:
+            return None
+        result = [
+            stop
+            for stop in best[1]
+            if all(w in stop["name"].lower() for w in words)
+        ]
+        if not result:
+            return None
+        self.prefix_hits += 1
+        return result
+
+    def stats(self) -> dict:
+        """Return the size and hit counts of the cache."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "hit_rate": rate(self.hits, self.misses),
+        }
+
+    def as_dict(self) -> dict:
+        """Return the cache contents in a form suitable for storage."""
+        self.dirty = False
+        return {
+            "entries": [
+                [key, stamp, value, complete]
+                for key, (stamp, value, complete) in self._entries.items()
+            ]
+        }
+
+    def load(self, data: dict) -> None:
+        """Load cache contents previously returned by as_dict."""
+        for key, stamp, value, *complete in data.get("entries", []):
+            # entries stored before completeness was tracked count as cut off
+            self._entries[key] = (stamp, value, bool(complete and complete[0]))
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
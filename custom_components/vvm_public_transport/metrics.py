@@ -0,0 +1,210 @@
+"""Performance metrics of the VVM requests and stop monitors."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+
+from .const import LATENCY_BUCKETS_MS
+
+
+def error_type(e: Exception) -> str:
+    """Return the name of the error, looking through wrapping ValueErrors."""
+    cause = e.__cause__
+    return type(cause if cause is not None else e).__name__
+
+
+def rate(hits: int, misses: int) -> float | None:
+    """Return the hit rate in percent, if there were any lookups."""
+    total = hits + misses
+    return round(100 * hits / total, 1) if total else None
+
+
+class Histogram:
+    """Histogram with fixed buckets, estimating percentiles by interpolation."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS) -> None:
+        """Construct an empty histogram with the given upper bucket bounds."""
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """Add a value."""
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float | None:
+        """Return the mean of the values."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p: float) -> float | None:
+        """Estimate the p-th percentile of the values."""
+        if not self.count:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self._counts):
+            upper = self._bounds[i] if i < len(self._bounds) else self.max
+            if n and seen + n >= target:
+                return min(self.max, lower + (upper - lower) * (target - seen) / n)
+            seen += n
+            lower = upper
+        return self.max
+
+    def as_dict(self) -> dict:
+        """Return a summary of the histogram."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": {
+                **{f"le_{b}": n for b, n in zip(self._bounds, self._counts)},
+                "inf": self._counts[-1],
+            },
+        }
+
+
+class Stat:
+    """Last, mean and maximum of a series of values."""
+
+    def __init__(self) -> None:
+        """Construct an empty series."""
+        self.last: float | None = None
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """Add a value."""
+        self.last = value
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float | None:
+        """Return the mean of the values."""
+        return self.total / self.count if self.count else None
+
+    def as_dict(self) -> dict:
+        """Return a summary of the series."""
+        return {
+            "last": self.last,
+            "mean": self.mean,
+            "max": self.max,
+            "count": self.count,
+        }
+
+
+class RequestMetrics:
+    """Latency, size, decode time and errors of requests."""
+
+    def __init__(self) -> None:
+        """Construct empty metrics."""
+        self.latency_ms = Histogram()
+        self.response_bytes = Stat()
+        self.decode_ms = Stat()
+        self.errors: Counter[str] = Counter()
+
+    def record_response(self, latency_ms, size, decode_ms) -> None:
+        """Account for a successful request."""
+        self.latency_ms.record(latency_ms)
+        self.response_bytes.record(size)
+        self.decode_ms.record(decode_ms)
+
+    def record_error(self, e: Exception) -> None:
+        """Account for a failed request."""
+        self.errors[error_type(e)] += 1
+
+    def as_dict(self) -> dict:
+        """Return the metrics in a serializable form."""
+        return {
+            "latency_ms": self.latency_ms.as_dict(),
+            "response_bytes": self.response_bytes.as_dict(),
+            "decode_ms": self.decode_ms.as_dict(),
+            "errors": dict(self.errors),
+        }
+
+
+class EndpointMetrics(RequestMetrics):
+    """Metrics of the HTTP requests sent to a single endpoint."""
+
+    def __init__(self) -> None:
+        """Construct empty metrics."""
+        super().__init__()
+        self.calls = 0
+        self.coalesced = 0
+
+    def as_dict(self) -> dict:
+        """Return the metrics in a serializable form."""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": rate(self.coalesced, self.calls - self.coalesced),
+            **super().as_dict(),
+        }
+
+
+class ApiMetrics:
+    """Metrics of all endpoints of the VVM access API."""
+
+    def __init__(self) -> None:
+        """Construct empty metrics."""
+        self.endpoints: dict[str, EndpointMetrics] = {}
+
+    def endpoint(self, url: str) -> EndpointMetrics:
+        """Return the metrics of the endpoint of an URL."""
+        name = url.rsplit("/", 1)[-1]
+        if (metrics := self.endpoints.get(name)) is None:
+            metrics = self.endpoints[name] = EndpointMetrics()
+        return metrics
+
+    def as_dict(self) -> dict:
+        """Return the metrics in a serializable form."""
+        return {name: m.as_dict() for name, m in self.endpoints.items()}
+
+
+class StopMetrics(RequestMetrics):
+    """Metrics of the polls of a single stop monitor."""
+
+    def __init__(self) -> None:
+        """Construct empty metrics."""
+        super().__init__()
+        self.update_ms = Histogram()
+        self.parse_ms = Stat()
+        self.parse_reused = 0
+        self.parse_full = 0
+        self.departures_received: int | None = None
+        self.departures_shown: int | None = None
+
+    @property
+    def error_count(self) -> int:
+        """Return the number of failed polls."""
+        return sum(self.errors.values())
+
+    @property
+    def parse_reuse_rate(self) -> float | None:
+        """Return the share of polls whose parsed departures were reused."""
+        return rate(self.parse_reused, self.parse_full)
+
+    def as_dict(self) -> dict:
+        """Return the metrics in a serializable form."""
+        return {
+            **super().as_dict(),
+            "update_ms": self.update_ms.as_dict(),
+            "parse_ms": self.parse_ms.as_dict(),
+            "parse_reused": self.parse_reused,
+            "parse_full": self.parse_full,
+            "parse_reuse_rate": self.parse_reuse_rate,
+            "departures_received": self.departures_received,
+            "departures_shown": self.departures_shown,
+        }
@@ -0,0 +1,147 @@
+"""Circuit breaker, retry budget and rate limit protecting the VVM endpoints."""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+
+from .const import (
+    BREAKER_BASE_BACKOFF,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_MAX_BACKOFF,
+    REQUEST_BURST,
+    REQUEST_RATE_LIMIT,
+    RETRY_BUDGET_MAX_TOKENS,
+    RETRY_BUDGET_RATIO,
+)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ValueError):
+    """Error raised when requests to an endpoint are suspended."""
+
+
+def jittered(delay: float) -> float:
+    """Return the delay with 'equal jitter': between half and all of it."""
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker of a single endpoint.
+
+    After failure_threshold consecutive failures the breaker opens for an
+    exponentially growing, jittered period. Afterwards a single probe request
+    is let through; its success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        base_backoff=BREAKER_BASE_BACKOFF,
+        max_backoff=BREAKER_MAX_BACKOFF,
+    ) -> None:
+        """Construct a closed breaker."""
+        self._failure_threshold = failure_threshold
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._failures = 0
+        self._open_count = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.state = STATE_CLOSED
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe request through."""
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Check if a request may be sent now."""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN and time.monotonic() >= self._open_until:
+            self.state = STATE_HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == STATE_HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the breaker."""
+        self.state = STATE_CLOSED
+        self._failures = 0
+        self._open_count = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Give up a request without an outcome, letting another one probe."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed request, opening the breaker if needed."""
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == STATE_HALF_OPEN or self._failures >= self._failure_threshold:
+            backoff = min(
+                self._max_backoff, self._base_backoff * 2**self._open_count
+            )
+            self._open_count += 1
+            self._open_until = time.monotonic() + jittered(backoff)
+            self.state = STATE_OPEN
+
+
+class RetryBudget:
+    """Allow retries only for a fraction of the requests sent.
+
+    Every request deposits ratio tokens and every retry withdraws a whole
+    one, so retries cannot multiply the load during an outage.
+    """
+
+    def __init__(
+        self, ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX_TOKENS
+    ) -> None:
+        """Construct a full budget."""
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+
+    def deposit(self) -> None:
+        """Account for a request."""
+        self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry, if there is one."""
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class TokenBucket:
+    """Limit the rate of requests sent to the VVM service.
+
+    Tokens are reserved in the order the callers arrive, so a caller that
+    finds the bucket empty sleeps until its own token has been refilled.
+    """
+
+    def __init__(self, rate=REQUEST_RATE_LIMIT, capacity=REQUEST_BURST) -> None:
+        """Construct a full bucket refilled with rate tokens per second."""
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self._rate)
@@ -0,0 +1,84 @@
+"""Short-lived cache of departure monitor responses by stop."""
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from .const import DM_RESPONSE_TTL
+from .metrics import rate
+
+
+def _means(pruning: dict) -> frozenset[str]:
+    """Return the means of transport a request is restricted to, empty if all."""
+    return frozenset(k for k in pruning if k.startswith("inclMOT_"))
+
+
+def covers(cached: dict, wanted: dict) -> bool:
+    """Check if a response pruned as cached has all departures of a wanted one."""
+    cached_means = _means(cached)
+    wanted_means = _means(wanted)
+    if cached_means and not (wanted_means and wanted_means <= cached_means):
+        return False
+    if "limit" in cached:
+        return "limit" in wanted and int(cached["limit"]) >= int(wanted["limit"])
+    return True
+
+
+class DepartureResponseCache:
+    """The last departure monitor response of every stop, for a few seconds.
+
+    Validating a stop, setting it up and the departure checks of trips ask
+    for the same departures within moments of each other; they share a
+    single upstream request through this cache. A response serves every
+    request it covers: an unpruned response serves any pruning, as the
+    departures are filtered client-side anyway. The TTL is shorter than the
+    poll interval, so regular polls always get fresh data.
+    """
+
+    def __init__(self, ttl=DM_RESPONSE_TTL.total_seconds()) -> None:
+        """Construct an empty cache."""
+        self.ttl = ttl
+        self._entries: dict[str, tuple[float, dict, Any]] = {}
+        self._pruned_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stop_id, pruning: dict) -> Any | None:
+        """Return a fresh response of the stop covering the pruning."""
+        entry = self._entries.get(stop_id)
+        if (
+            entry is None
+            or time.monotonic() - entry[0] >= self.ttl
+            or not covers(entry[1], pruning)
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2]
+
+    def put(self, stop_id, pruning: dict, payload) -> None:
+        """Store a response, unless a fresh one covering it is cached."""
+        now = time.monotonic()
+        entry = self._entries.get(stop_id)
+        if (
+            entry is not None
+            and now - entry[0] < self.ttl
+            and covers(entry[1], pruning)
+            and not covers(pruning, entry[1])
+        ):
+            return
+        if now - self._pruned_at >= self.ttl:
+            # drop the expired responses, at most once per TTL
+            self._pruned_at = now
+            for key in [k for k, e in self._entries.items() if now - e[0] >= self.ttl]:
+                del self._entries[key]
+        self._entries[stop_id] = (now, dict(pruning), payload)
+
+    def stats(self) -> dict:
+        """Return the size and hit counters of the cache."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": rate(self.hits, self.misses),
+        }
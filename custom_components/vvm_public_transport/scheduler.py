@@ -0,0 +1,77 @@
+"""Adaptive poll scheduling for VVM stop monitors."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from .const import (
+    DEFAULT_POLL_INTERVAL,
+    IMMINENT_DEPARTURE_MINUTES,
+    MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    QUIET_POLL_INTERVAL,
+)
+from .vvm_access import VVMStopMonitorHA
+
+
+def in_quiet_hours(quiet_hours, now: datetime) -> bool:
+    """Check if the given moment falls into the (start, end) quiet hours."""
+    if quiet_hours is None:
+        return False
+    start, end = quiet_hours
+    t = now.time()
+    if start <= end:
+        return start <= t < end
+    return t >= start or t < end
+
+
+def time_until(t, now: datetime) -> timedelta:
+    """Return the time left until the next occurrence of the time of day t."""
+    target = datetime.combine(now.date(), t)
+    if target <= now:
+        target += timedelta(days=1)
+    return target - now
+
+
+class VVMAdaptiveScheduler:
+    """Pick the next poll time of a stop from what its last poll returned."""
+
+    def __init__(self) -> None:
+        """Construct the scheduler for a single stop."""
+        self._last_delays: list[tuple] | None = None
+
+    def next_interval(self, monitor: VVMStopMonitorHA, now: datetime) -> timedelta:
+        """Return how long to wait before polling the monitor again."""
+        quiet_hours = monitor.quiet_hours
+        if in_quiet_hours(quiet_hours, now):
+            return max(
+                MIN_POLL_INTERVAL,
+                min(QUIET_POLL_INTERVAL, time_until(quiet_hours[1], now)),
+            )
+
+        if monitor.stale:
+            return DEFAULT_POLL_INTERVAL
+
+        departures = getattr(monitor, "departures", [])
+        if len(departures) == 0:
+            # nothing is due within the timespan, so wait for the horizon to move
+            interval = timedelta(minutes=monitor.timespan / 2)
+        else:
+            delays = [(d.num, d.to, d.delay) for d in departures[:3]]
+            delays_changed = (
+                self._last_delays is not None and delays != self._last_delays
+            )
+            self._last_delays = delays
+
+            if delays_changed:
+                # follow a developing delay closely
+                return MIN_POLL_INTERVAL
+            left = departures[0].left
+            if left <= IMMINENT_DEPARTURE_MINUTES:
+                # the countdowns are kept current locally, only delays need a poll
+                return DEFAULT_POLL_INTERVAL
+            interval = timedelta(minutes=left / 2)
+
+        interval = max(DEFAULT_POLL_INTERVAL, min(MAX_POLL_INTERVAL, interval))
+        if quiet_hours is not None:
+            interval = min(interval, time_until(quiet_hours[0], now))
+        return max(MIN_POLL_INTERVAL, interval)
@@ -1,15 +1,64 @@
 """VVM Stop departure monitor as a sensor."""
 
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import (
+    PERCENTAGE,
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTime,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.update_coordinator import (
+    CoordinatorEntity,
+    DataUpdateCoordinator,
+)
 
-from .const import DOMAIN
+from .const import (
+    ATTR_DEPARTURE_FIELDS,
+    ATTR_DEPARTURES,
+    ATTRIBUTE_MODE_COMPACT,
+    ATTRIBUTE_MODE_FULL,
+    COMPACT_DEPARTURE_FIELDS,
+    CONF_ENTRY_TYPE,
+    CONF_MAX_DEPARTURES,
+    CONF_STOPS,
+    DATA_TRIPS,
+    DOMAIN,
+    ENTRY_TYPE_BOARD,
+    ENTRY_TYPE_TRIP,
+    SIGNAL_POLLED,
+    SIGNAL_STOP_ADDED,
+    SIGNAL_STOP_REMOVED,
+)
+from .board import DepartureBoard
+from .departure import minutes_until
 from .coordinator_base import VVMStopCoordinatorEntityBase
+from .metrics import StopMetrics
+from .trip import VVMTripMonitor
 from .vvm_access import VVMStopMonitorHA
 
 
 async def async_setup_entry(hass, entry, async_add_entities):
     """Set up VVM Stop entry."""
+    if entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_BOARD:
+        async_add_entities([VVMDepartureBoardSensor(entry)])
+        return
+    if entry.data.get(CONF_ENTRY_TYPE) == ENTRY_TYPE_TRIP:
+        coordinator = hass.data[DATA_TRIPS][entry.entry_id]
+        async_add_entities(
+            [
+                VVMTripSummarySensor(coordinator, entry),
+                VVMTripTimeLeftSensor(coordinator, entry),
+            ]
+        )
+        return
+
     coordinator = hass.data[DOMAIN][entry.entry_id]
     async_add_entities(
         [
@@ -18,6 +67,17 @@ async def async_setup_entry(hass, entry, async_add_entities):
             VVMStopDepartureNearestDelay(coordinator),
             VVMStopDepartureNearestVehicleType(coordinator),
             VVMStopDepartureNearestVehicleNum(coordinator),
+            VVMStopRequestLatency(coordinator, entry.entry_id),
+            VVMStopResponseSize(coordinator, entry.entry_id),
+            VVMStopDecodeTime(coordinator, entry.entry_id),
+            VVMStopParseTime(coordinator, entry.entry_id),
+            VVMStopDeparturesReceived(coordinator, entry.entry_id),
+            VVMStopDeparturesShown(coordinator, entry.entry_id),
+            VVMStopErrors(coordinator, entry.entry_id),
+            VVMStopParseReuseRate(coordinator, entry.entry_id),
+            VVMStopMeanDelay(coordinator),
+            VVMStopP90Delay(coordinator),
+            VVMStopOnTimeRatio(coordinator),
         ]
     )
 
@@ -33,28 +93,55 @@ class VVMStopSensorEntityBase(VVMStopCoordinatorEntityBase, SensorEntity):
 
 
 class VVMStopDepartureNearest(VVMStopSensorEntityBase):
-    """Entity representing a public transport stop to monitor for departures."""
+    """Entity representing a public transport stop to monitor for departures.
+
+    Depending on the attribute mode the departures are published as dicts, as
+    compact rows of COMPACT_DEPARTURE_FIELDS or not at all. They are never
+    recorded; the get_departures service returns them on demand.
+    """
+
+    _unrecorded_attributes = frozenset({ATTR_DEPARTURES, ATTR_DEPARTURE_FIELDS})
 
     def __init__(self, coordinator: DataUpdateCoordinator[VVMStopMonitorHA]) -> None:
         """Construct the nearest sensor."""
         super().__init__(coordinator, "Summary")
-        self.extra = {
-            "departures": self.coordinator.data.departures,
-            "last_updated": self.coordinator.data.last_updated,
-            "last_updated_simple": self.coordinator.data.last_updated_simple,
-            "stop_name": self.coordinator.data.stop_name,
-            "stale": self.coordinator.data.stale,
-        }
+        self._departures_source = None
+        self._departures_mode = None
+        self._departures = None
+
+    def _departures_attribute(self):
+        """Return the departures attribute, rebuilt only when they changed."""
+        data = self.coordinator.data
+        if (
+            data.departures is not self._departures_source
+            or data.attribute_mode != self._departures_mode
+        ):
+            self._departures_source = data.departures
+            self._departures_mode = data.attribute_mode
+            if data.attribute_mode == ATTRIBUTE_MODE_FULL:
+                self._departures = [d.as_dict() for d in data.departures]
+            elif data.attribute_mode == ATTRIBUTE_MODE_COMPACT:
+                self._departures = [d.as_row() for d in data.departures]
+            else:
+                self._departures = None
+        return self._departures
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes of the device."""
-        self.extra["departures"] = self.coordinator.data.departures
-        self.extra["last_updated"] = self.coordinator.data.last_updated
-        self.extra["last_updated_simple"] = self.coordinator.data.last_updated_simple
-        self.extra["stop_name"] = self.coordinator.data.stop_name
-        self.extra["stale"] = self.coordinator.data.stale
-        return self.extra
+        data = self.coordinator.data
+        attributes = {
+            "last_updated": data.last_updated,
+            "last_updated_simple": data.last_updated_simple,
+            "stop_name": data.stop_name,
+            "stale": data.stale,
+        }
+        departures = self._departures_attribute()
+        if departures is not None:
+            attributes[ATTR_DEPARTURES] = departures
+        if data.attribute_mode == ATTRIBUTE_MODE_COMPACT:
+            attributes[ATTR_DEPARTURE_FIELDS] = COMPACT_DEPARTURE_FIELDS
+        return attributes
 
     @property
     def native_value(self):
@@ -112,3 +199,441 @@ class VVMStopDepartureNearestVehicleNum(VVMStopSensorEntityBase):
     def native_value(self):
         """Return the state of the sensor."""
         return self.coordinator.data.nearest_vehicle_num
+
+
+class VVMStopDelaySensorBase(VVMStopSensorEntityBase):
+    """Base of the sensors showing the delay history of a stop.
+
+    The statistics are taken once per coordinator update, not per property.
+    """
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator, sensor_id) -> None:
+        """Construct the delay sensor."""
+        super().__init__(coordinator, sensor_id)
+        self.stats: dict = coordinator.data.delay_history.stats()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Take the delay statistics of the stop, then write the state."""
+        self.stats = self.coordinator.data.delay_history.stats()
+        super()._handle_coordinator_update()
+
+
+class VVMStopMeanDelay(VVMStopDelaySensorBase):
+    """Sensor for the mean delay of the recorded departures, by line in attributes."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MINUTES
+    _attr_suggested_display_precision = 1
+    _unrecorded_attributes = frozenset({"lines"})
+
+    def __init__(self, coordinator) -> None:
+        """Construct the Mean Delay sensor."""
+        super().__init__(coordinator, "Mean Delay")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.stats["mean"]
+
+    @property
+    def extra_state_attributes(self):
+        """Return the number of recorded departures and the lines' statistics."""
+        return {"count": self.stats["count"], "lines": self.stats["lines"]}
+
+
+class VVMStopP90Delay(VVMStopDelaySensorBase):
+    """Sensor for the delay 90 percent of the recorded departures stay within."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MINUTES
+
+    def __init__(self, coordinator) -> None:
+        """Construct the P90 Delay sensor."""
+        super().__init__(coordinator, "P90 Delay")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.stats["p90"]
+
+
+class VVMStopOnTimeRatio(VVMStopDelaySensorBase):
+    """Sensor for the share of recorded departures that were on time."""
+
+    _attr_native_unit_of_measurement = PERCENTAGE
+
+    def __init__(self, coordinator) -> None:
+        """Construct the On-Time Ratio sensor."""
+        super().__init__(coordinator, "On-Time Ratio")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.stats["on_time"]
+
+
+class VVMStopMetricSensorBase(VVMStopSensorEntityBase):
+    """Base of the diagnostic sensors showing the poll metrics of a stop.
+
+    The sensors are written after every poll, also when the departures did not
+    change and the coordinator is not updated.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator, entry_id, sensor_id) -> None:
+        """Construct the metric sensor."""
+        super().__init__(coordinator, sensor_id)
+        self._entry_id = entry_id
+
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the polls of the stop."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                f"{SIGNAL_POLLED}_{self._entry_id}",
+                self.async_write_ha_state_if_changed,
+            )
+        )
+
+    @property
+    def metrics(self) -> StopMetrics:
+        """Access the metrics of the stop."""
+        return self.coordinator.data.api.metrics
+
+
+class VVMStopRequestLatency(VVMStopMetricSensorBase):
+    """Sensor for the 95th percentile of the departure request latency."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_suggested_display_precision = 0
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Request Latency sensor."""
+        super().__init__(coordinator, entry_id, "Request Latency")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.latency_ms.percentile(95)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the latency percentiles."""
+        latency = self.metrics.latency_ms
+        return {
+            "p50": latency.percentile(50),
+            "p95": latency.percentile(95),
+            "p99": latency.percentile(99),
+            "mean": latency.mean,
+            "count": latency.count,
+        }
+
+
+class VVMStopResponseSize(VVMStopMetricSensorBase):
+    """Sensor for the size of the last departure response."""
+
+    _attr_device_class = SensorDeviceClass.DATA_SIZE
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfInformation.BYTES
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Response Size sensor."""
+        super().__init__(coordinator, entry_id, "Response Size")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.response_bytes.last
+
+
+class VVMStopDecodeTime(VVMStopMetricSensorBase):
+    """Sensor for the JSON decoding time of the last departure response."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_suggested_display_precision = 2
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Decode Time sensor."""
+        super().__init__(coordinator, entry_id, "Decode Time")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.decode_ms.last
+
+
+class VVMStopParseTime(VVMStopMetricSensorBase):
+    """Sensor for the time of the last full parse of the departures."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_suggested_display_precision = 2
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Parse Time sensor."""
+        super().__init__(coordinator, entry_id, "Parse Time")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.parse_ms.last
+
+
+class VVMStopDeparturesReceived(VVMStopMetricSensorBase):
+    """Sensor for the number of departures within the timeframe."""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Departures Received sensor."""
+        super().__init__(coordinator, entry_id, "Departures Received")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.departures_received
+
+
+class VVMStopDeparturesShown(VVMStopMetricSensorBase):
+    """Sensor for the number of departures passing the filters."""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Departures Shown sensor."""
+        super().__init__(coordinator, entry_id, "Departures Shown")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.departures_shown
+
+
+class VVMStopErrors(VVMStopMetricSensorBase):
+    """Sensor for the number of failed polls, by error type in the attributes."""
+
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Errors sensor."""
+        super().__init__(coordinator, entry_id, "Errors")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.error_count
+
+    @property
+    def extra_state_attributes(self):
+        """Return the error counts by type."""
+        return dict(self.metrics.errors)
+
+
+class VVMStopParseReuseRate(VVMStopMetricSensorBase):
+    """Sensor for the share of polls that reused the parsed departures."""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = PERCENTAGE
+
+    def __init__(self, coordinator, entry_id) -> None:
+        """Construct the Parse Cache Hit Rate sensor."""
+        super().__init__(coordinator, entry_id, "Parse Cache Hit Rate")
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self.metrics.parse_reuse_rate
+
+    @property
+    def extra_state_attributes(self):
+        """Return the hit and miss counts."""
+        return {
+            "reused": self.metrics.parse_reused,
+            "parsed": self.metrics.parse_full,
+        }
+
+
+class VVMDepartureBoardSensor(SensorEntity):
+    """Sensor merging the departures of several stops into one board.
+
+    The board follows the coordinators of its stops as they are loaded and
+    unloaded, and merges the departures of a stop whenever it updates.
+    """
+
+    _attr_has_entity_name = True
+    _attr_name = None
+    _attr_should_poll = False
+    _unrecorded_attributes = frozenset({ATTR_DEPARTURES})
+
+    def __init__(self, entry) -> None:
+        """Construct the board sensor."""
+        self._stops = set(entry.data[CONF_STOPS])
+        self._board = DepartureBoard(entry.data[CONF_MAX_DEPARTURES])
+        self._unsub_stops = {}
+        self._stop_names = {}
+        self._departures_source = None
+        self._departures = []
+        self._attr_unique_id = f"{DOMAIN}_board_{entry.entry_id}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"board_{entry.entry_id}")},
+            name=entry.title,
+            manufacturer="VVM",
+        )
+
+    async def async_added_to_hass(self) -> None:
+        """Attach to the stops that are loaded and follow the others."""
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_STOP_ADDED, self._async_stop_added
+            )
+        )
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_STOP_REMOVED, self._async_stop_removed
+            )
+        )
+        self.async_on_remove(self._async_detach_all)
+        for entry_id, coordinator in self.hass.data.get(DOMAIN, {}).items():
+            self._async_stop_added(entry_id, coordinator)
+
+    @callback
+    def _async_stop_added(self, entry_id, coordinator) -> None:
+        """Merge the departures of a stop of the board on every update."""
+        if entry_id not in self._stops:
+            return
+        if (unsub := self._unsub_stops.pop(entry_id, None)) is not None:
+            unsub()
+
+        @callback
+        def async_stop_updated() -> None:
+            monitor: VVMStopMonitorHA = coordinator.data
+            self._stop_names[entry_id] = monitor.stop_name
+            if self._board.update_stop(
+                entry_id, monitor.stop_name, monitor.departures
+            ):
+                self.async_write_ha_state()
+
+        self._unsub_stops[entry_id] = coordinator.async_add_listener(
+            async_stop_updated
+        )
+        async_stop_updated()
+
+    @callback
+    def _async_stop_removed(self, entry_id) -> None:
+        """Drop the departures of an unloaded stop."""
+        if (unsub := self._unsub_stops.pop(entry_id, None)) is None:
+            return
+        unsub()
+        self._stop_names.pop(entry_id, None)
+        if self._board.remove_stop(entry_id):
+            self.async_write_ha_state()
+
+    @callback
+    def _async_detach_all(self) -> None:
+        """Stop following the stops."""
+        for unsub in self._unsub_stops.values():
+            unsub()
+        self._unsub_stops.clear()
+
+    @property
+    def native_value(self):
+        """Return the next departure of the board."""
+        if not self._board.departures:
+            return "Unknown"
+        d, stop = self._board.departures[0]
+        return f"({d.left:d} min) {d.type} {d.num} ({d.to}, {stop})"
+
+    @property
+    def extra_state_attributes(self):
+        """Return the merged departures with the stop they leave from."""
+        if self._board.departures is not self._departures_source:
+            self._departures_source = self._board.departures
+            self._departures = [
+                {**d.as_dict(), "stop": stop} for d, stop in self._board.departures
+            ]
+        return {
+            ATTR_DEPARTURES: self._departures,
+            "stops": list(self._stop_names.values()),
+        }
+
+
+class VVMTripSensorBase(
+    CoordinatorEntity[DataUpdateCoordinator[VVMTripMonitor]], SensorEntity
+):
+    """Base functionality of the sensors of a connection between two stops."""
+
+    _attr_has_entity_name = True
+
+    def __init__(self, coordinator, entry, sensor_id) -> None:
+        """Construct the base sensor class."""
+        super().__init__(coordinator)
+        self._attr_name = sensor_id
+        self._attr_unique_id = f"{DOMAIN}_trip_{entry.entry_id}_{sensor_id}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"trip_{entry.entry_id}")},
+            name=entry.title,
+            manufacturer="VVM",
+        )
+
+
+class VVMTripSummarySensor(VVMTripSensorBase):
+    """Sensor for the next connections between two stops."""
+
+    _unrecorded_attributes = frozenset({"trips"})
+
+    def __init__(self, coordinator, entry) -> None:
+        """Construct the connection summary sensor."""
+        super().__init__(coordinator, entry, "Summary")
+
+    @property
+    def native_value(self):
+        """Return the next connection."""
+        trip = self.coordinator.data.next_trip
+        if trip is None:
+            return "Unknown"
+        return "({:d} min) {} → {} {}".format(
+            minutes_until(trip.real_departure),
+            trip.real_departure.strftime("%H:%M"),
+            trip.real_arrival.strftime("%H:%M"),
+            trip.summary,
+        )
+
+    @property
+    def extra_state_attributes(self):
+        """Return the next connections with their legs."""
+        data = self.coordinator.data
+        return {
+            "origin": data.origin_name,
+            "destination": data.destination_name,
+            "trips": [t.as_dict() for t in data.trips],
+            "last_updated": data.last_updated,
+            "last_planned": data.last_planned,
+            "stale": data.stale,
+        }
+
+
+class VVMTripTimeLeftSensor(VVMTripSensorBase):
+    """Sensor for the minutes until the next connection leaves."""
+
+    _attr_native_unit_of_measurement = UnitOfTime.MINUTES
+
+    def __init__(self, coordinator, entry) -> None:
+        """Construct the connection Time Left sensor."""
+        super().__init__(coordinator, entry, "Time Left")
+
+    @property
+    def native_value(self):
+        """Return the minutes until the next connection leaves."""
+        trip = self.coordinator.data.next_trip
+        if trip is None:
+            return None
+        return minutes_until(trip.real_departure)
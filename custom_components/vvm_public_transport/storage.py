@@ -0,0 +1,169 @@
+"""Persistence of VVM integration state in Home Assistant storage."""
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DATA_CATALOG_STORE,
+    DATA_LOOKUP_STORE,
+    DELAY_HISTORY_SAVE_DELAY,
+    DELAY_HISTORY_STORAGE_KEY,
+    LOOKUP_CACHE_SAVE_DELAY,
+    LOOKUP_CACHE_STORAGE_KEY,
+    SNAPSHOT_SAVE_DELAY,
+    SNAPSHOT_STORAGE_KEY,
+    STOP_CATALOG_STORAGE_KEY,
+    STORAGE_VERSION,
+)
+from .history import StopDelayHistory
+from .vvm_access import VVMAccessApi, VVMStopMonitorHA
+
+
+async def _async_load(hass: HomeAssistant, data_key, storage_key, target) -> None:
+    """Load a persisted object once per Home Assistant run."""
+    if data_key in hass.data:
+        return
+    store = Store(hass, STORAGE_VERSION, storage_key)
+    hass.data[data_key] = store
+    if (data := await store.async_load()) is not None:
+        target.load(data)
+
+
+@callback
+def _async_save(hass: HomeAssistant, data_key, target) -> None:
+    """Schedule saving a persisted object if it changed."""
+    store = hass.data.get(data_key)
+    if store is not None and target.dirty:
+        store.async_delay_save(target.as_dict, LOOKUP_CACHE_SAVE_DELAY)
+
+
+async def async_load_lookup_data(hass: HomeAssistant) -> None:
+    """Load the persisted stop lookup cache and stop catalog."""
+    await _async_load(
+        hass, DATA_LOOKUP_STORE, LOOKUP_CACHE_STORAGE_KEY, VVMAccessApi.lookup_cache
+    )
+    await _async_load(
+        hass, DATA_CATALOG_STORE, STOP_CATALOG_STORAGE_KEY, VVMAccessApi.stop_catalog
+    )
+
+
+@callback
+def async_save_lookup_data(hass: HomeAssistant) -> None:
+    """Schedule saving the stop lookup cache and stop catalog if they changed."""
+    _async_save(hass, DATA_LOOKUP_STORE, VVMAccessApi.lookup_cache)
+    _async_save(hass, DATA_CATALOG_STORE, VVMAccessApi.stop_catalog)
+
+
+class VVMSnapshotStore:
+    """Departure snapshots of all stops, kept in Home Assistant storage."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Construct the snapshot store."""
+        self._store = Store(hass, STORAGE_VERSION, SNAPSHOT_STORAGE_KEY)
+        self._snapshots: dict[str, dict] = {}
+        self._monitors: dict[str, VVMStopMonitorHA] = {}
+        self._save_scheduled = False
+
+    async def async_load(self) -> None:
+        """Load the persisted snapshots."""
+        if (data := await self._store.async_load()) is not None:
+            self._snapshots = data
+
+    def get(self, entry_id: str) -> dict | None:
+        """Return the snapshot of a config entry, if there is one."""
+        return self._snapshots.get(entry_id)
+
+    @callback
+    def async_track(self, entry_id: str, monitor: VVMStopMonitorHA) -> None:
+        """Snapshot the monitor of a config entry from now on."""
+        self._monitors[entry_id] = monitor
+
+    @callback
+    def async_untrack(self, entry_id: str) -> None:
+        """Stop snapshotting the monitor of a config entry, keeping the last one."""
+        if (monitor := self._monitors.pop(entry_id, None)) is not None:
+            self._snapshots[entry_id] = monitor.as_snapshot()
+
+    @callback
+    def async_remove(self, entry_id: str) -> None:
+        """Forget the snapshot of a removed config entry."""
+        self._monitors.pop(entry_id, None)
+        if self._snapshots.pop(entry_id, None) is not None:
+            self.async_schedule_save()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Schedule saving the snapshots unless a save is already pending."""
+        if not self._save_scheduled:
+            self._save_scheduled = True
+            self._store.async_delay_save(self._data_to_save, SNAPSHOT_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        """Snapshot all tracked monitors."""
+        self._save_scheduled = False
+        for entry_id, monitor in self._monitors.items():
+            self._snapshots[entry_id] = monitor.as_snapshot()
+        return self._snapshots
+
+
+class VVMDelayHistoryStore:
+    """Delay histories of all stops, kept in Home Assistant storage.
+
+    Histories change whenever a trip departs, so they are saved with a long
+    delay and only if any of them recorded something since the last save.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Construct the delay history store."""
+        self._store = Store(hass, STORAGE_VERSION, DELAY_HISTORY_STORAGE_KEY)
+        self._stored: dict[str, dict] = {}
+        self._histories: dict[str, StopDelayHistory] = {}
+        self._save_scheduled = False
+
+    async def async_load(self) -> None:
+        """Load the persisted histories."""
+        if (data := await self._store.async_load()) is not None:
+            self._stored = data
+
+    @callback
+    def async_get(self, entry_id: str) -> StopDelayHistory:
+        """Return the history of a config entry, loading it if it was saved."""
+        if (history := self._histories.get(entry_id)) is None:
+            history = self._histories[entry_id] = StopDelayHistory()
+            if (data := self._stored.get(entry_id)) is not None:
+                history.load(data)
+        return history
+
+    @callback
+    def async_untrack(self, entry_id: str) -> None:
+        """Keep the history of an unloaded config entry for saving only."""
+        if (history := self._histories.pop(entry_id, None)) is not None:
+            self._stored[entry_id] = history.as_dict()
+
+    @callback
+    def async_remove(self, entry_id: str) -> None:
+        """Forget the history of a removed config entry."""
+        self._histories.pop(entry_id, None)
+        if self._stored.pop(entry_id, None) is not None:
+            self._async_delay_save()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Schedule saving the histories if any of them changed."""
+        if any(history.dirty for history in self._histories.values()):
+            self._async_delay_save()
+
+    @callback
+    def _async_delay_save(self) -> None:
+        """Schedule a save unless one is already pending."""
+        if not self._save_scheduled:
+            self._save_scheduled = True
+            self._store.async_delay_save(self._data_to_save, DELAY_HISTORY_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        """Collect the histories of all config entries."""
+        self._save_scheduled = False
+        for entry_id, history in self._histories.items():
+            self._stored[entry_id] = history.as_dict()
+        return self._stored
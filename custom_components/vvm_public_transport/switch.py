@@ -52,8 +52,11 @@ class VVMStopSwitchFilterEntityBase(VVMStopCoordinatorEntityBase, SwitchEntity):
     async def async_turn_on(self, **kwargs):
         """Turn the entity on."""
         if not self.is_on:
-            self.coordinator.data.filter_types.append(self._vehicle_type)
-            await self.coordinator.async_request_refresh()
+            self.coordinator.data.filter_types = [
+                *self.coordinator.data.filter_types,
+                self._vehicle_type,
+            ]
+            await self.async_apply_filters()
 
     async def async_turn_off(self, **kwargs):
         """Turn the entity off."""
@@ -61,8 +64,12 @@ class VVMStopSwitchFilterEntityBase(VVMStopCoordinatorEntityBase, SwitchEntity):
             self.coordinator.data.filter_types = V_TYPE_LIST.copy()
 
         if self.is_on:
-            self.coordinator.data.filter_types.remove(self._vehicle_type)
-            await self.coordinator.async_request_refresh()
+            self.coordinator.data.filter_types = [
+                t
+                for t in self.coordinator.data.filter_types
+                if t != self._vehicle_type
+            ]
+            await self.async_apply_filters()
 
 
 class VVMStopDepartureFilterTram(VVMStopSwitchFilterEntityBase):
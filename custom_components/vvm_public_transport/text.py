@@ -28,8 +28,11 @@ class VVMStopTextFilterNums(VVMStopCoordinatorEntityBase, TextEntity):
 
     async def async_set_value(self, value: str) -> None:
         """Set the text value."""
-        self.coordinator.data.filter_nums = value
-        await self.coordinator.async_request_refresh()
+        monitor = self.coordinator.data
+        old = monitor.filter_nums
+        monitor.filter_nums = value
+        if monitor.filter_nums != old:
+            await self.async_apply_filters()
 
     @property
     def native_value(self):
@@ -48,8 +51,11 @@ class VVMStopTextFilterDirections(VVMStopCoordinatorEntityBase, TextEntity):
 
     async def async_set_value(self, value: str) -> None:
         """Set the text value."""
-        self.coordinator.data.filter_direction = value
-        await self.coordinator.async_request_refresh()
+        monitor = self.coordinator.data
+        old = monitor.filter_direction
+        monitor.filter_direction = value
+        if monitor.filter_direction != old:
+            await self.async_apply_filters()
 
     @property
     def native_value(self):
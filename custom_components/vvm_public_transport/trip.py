@@ -0,0 +1,512 @@
+"""Connections between two stops from the VVM trip request."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+from time import perf_counter
+
+from .const import (
+    DEFAULT_TRIP_COUNT,
+    TRIP_CACHE_MAX_ENTRIES,
+    TRIP_CACHE_TTL,
+    TRIP_TIME_BUCKET,
+    TRIP_WATCH_MINUTES,
+)
+from .departure import minutes_between, minutes_until, parse_efa_datetime
+from .metrics import StopMetrics, error_type
+from .vvm_access import VVMAccessApi, VVMStopMonitor
+
+_LOGGER = logging.getLogger(__name__)
+
+# EFA means of transport of footpaths, transfers and on-demand walking links
+WALK_MODE_TYPES = frozenset({"96", "97", "98", "99", "100", "105", "106", "107"})
+
+
+def _as_list(value, key):
+    """Return a list of elements that EFA may also return singly or wrapped."""
+    if isinstance(value, dict):
+        value = value.get(key, value)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _point_times(point: dict, cache: dict):
+    """Return the planned and realtime time of a trip point.
+
+    EFA either sends 'd.m.Y' and 'H:M' strings with rtDate/rtTime, or the
+    date/time dicts of the departure monitor with a realDateTime sibling.
+    """
+    dt = point.get("dateTime")
+    if not dt:
+        raise ValueError("point without time")
+    if "year" in dt:
+        should = parse_efa_datetime(dt, cache)
+        real = point.get("realDateTime")
+        return should, parse_efa_datetime(real, cache) if real else should
+    should = _parse_date_time(dt.get("date"), dt.get("time"), cache)
+    if dt.get("rtTime"):
+        real = _parse_date_time(dt.get("rtDate") or dt["date"], dt["rtTime"], cache)
+    else:
+        real = should
+    return should, real
+
+
+def _parse_date_time(date, time, cache: dict) -> datetime:
+    """Convert 'd.m.Y' and 'H:M' strings, reusing instances in the cache."""
+    key = (date, time)
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = datetime.strptime(f"{date} {time}", "%d.%m.%Y %H:%M")
+    return value
+
+
+def time_bucket(moment: datetime) -> datetime:
+    """Return the start of the TRIP_TIME_BUCKET the moment falls into."""
+    moment = moment.replace(second=0, microsecond=0)
+    return moment - (moment - datetime.min) % TRIP_TIME_BUCKET
+
+
+class TripLeg:
+    """A part of a connection ridden with a single vehicle or walked."""
+
+    __slots__ = (
+        "type",
+        "num",
+        "to",
+        "origin_id",
+        "origin_name",
+        "destination_id",
+        "destination_name",
+        "should_departure",
+        "real_departure",
+        "should_arrival",
+        "real_arrival",
+        "walk",
+    )
+
+    def __init__(
+        self,
+        vehicle_type,
+        num,
+        to,
+        origin_id,
+        origin_name,
+        destination_id,
+        destination_name,
+        should_departure,
+        real_departure,
+        should_arrival,
+        real_arrival,
+        walk=False,
+    ) -> None:
+        """Construct the leg."""
+        self.type = vehicle_type
+        self.num = num
+        self.to = to
+        self.origin_id = origin_id
+        self.origin_name = origin_name
+        self.destination_id = destination_id
+        self.destination_name = destination_name
+        self.should_departure = should_departure
+        self.real_departure = real_departure
+        self.should_arrival = should_arrival
+        self.real_arrival = real_arrival
+        self.walk = walk
+
+    @property
+    def delay(self) -> int:
+        """Return the departure delay in minutes."""
+        return minutes_between(self.should_departure, self.real_departure)
+
+    @property
+    def key(self) -> tuple:
+        """Identify the departure of the leg in the departure monitor."""
+        return (self.origin_id, self.num, self.should_departure)
+
+    def as_dict(self) -> dict:
+        """Return the leg as a dict."""
+        return {
+            "type": self.type,
+            "num": self.num,
+            "to": self.to,
+            "from_stop": self.origin_name,
+            "to_stop": self.destination_name,
+            "departure": self.real_departure.strftime("%H:%M"),
+            "arrival": self.real_arrival.strftime("%H:%M"),
+            "delay": self.delay,
+            "walk": self.walk,
+        }
+
+
+class Trip:
+    """A connection between two stops made of one or more legs."""
+
+    __slots__ = ("legs", "interchanges")
+
+    def __init__(self, legs: list[TripLeg], interchanges: int) -> None:
+        """Construct the connection."""
+        self.legs = legs
+        self.interchanges = interchanges
+
+    @property
+    def rides(self) -> list[TripLeg]:
+        """Return the legs ridden with a vehicle."""
+        return [leg for leg in self.legs if not leg.walk]
+
+    @property
+    def real_departure(self) -> datetime:
+        """Return the realtime departure of the connection."""
+        return self.legs[0].real_departure
+
+    @property
+    def real_arrival(self) -> datetime:
+        """Return the realtime arrival of the connection."""
+        return self.legs[-1].real_arrival
+
+    @property
+    def duration(self) -> int:
+        """Return the travel time in minutes."""
+        return minutes_between(self.real_departure, self.real_arrival)
+
+    @property
+    def summary(self) -> str:
+        """Return the lines of the connection, e.g. 'Straßenbahn 1, Bus 10'."""
+        rides = self.rides
+        if not rides:
+            return "Walk"
+        return ", ".join(f"{leg.type} {leg.num}" for leg in rides)
+
+    def as_dict(self, now: datetime | None = None) -> dict:
+        """Return the connection as a dict."""
+        return {
+            "left": minutes_until(self.real_departure, now),
+            "departure": self.real_departure.strftime("%H:%M"),
+            "arrival": self.real_arrival.strftime("%H:%M"),
+            "duration": self.duration,
+            "interchanges": self.interchanges,
+            "delay": self.legs[0].delay,
+            "summary": self.summary,
+            "legs": [leg.as_dict() for leg in self.legs],
+        }
+
+
+def parse_trips(data) -> list[Trip]:
+    """Parse the connections of a trip response, skipping incomplete ones."""
+    trips = []
+    dt_cache: dict = {}
+    for t in _as_list(data.get("trips") if isinstance(data, dict) else None, "trip"):
+        legs = []
+        try:
+            for leg in _as_list(t.get("legs"), "leg"):
+                points = _as_list(leg.get("points"), "point")
+                if len(points) < 2:
+                    raise ValueError("leg without departure and arrival point")
+                dep, arr = points[0], points[-1]
+                mode = leg.get("mode") or {}
+                should_dep, real_dep = _point_times(dep, dt_cache)
+                should_arr, real_arr = _point_times(arr, dt_cache)
+                num = mode.get("number") or ""
+                legs.append(
+                    TripLeg(
+                        mode.get("product") or mode.get("name") or "",
+                        num,
+                        mode.get("destination", ""),
+                        (dep.get("ref") or {}).get("id") or dep.get("stateless", ""),
+                        dep.get("name", ""),
+                        (arr.get("ref") or {}).get("id") or arr.get("stateless", ""),
+                        arr.get("name", ""),
+                        should_dep,
+                        real_dep,
+                        should_arr,
+                        real_arr,
+                        not num or mode.get("type") in WALK_MODE_TYPES,
+                    )
+                )
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            _LOGGER.debug("Skipping unparsable connection: %s", e)
+            continue
+        if legs:
+            trips.append(Trip(legs, int(t.get("interchange") or 0)))
+    trips.sort(key=lambda trip: trip.real_departure)
+    return trips
+
+
+class TripCache:
+    """Connections by origin, destination and requested time bucket.
+
+    Connections are shared between all trip monitors of the same origin and
+    destination. Entries expire after TRIP_CACHE_TTL and the least recently
+    used entries are evicted above the maximum size.
+    """
+
+    def __init__(self, max_entries=TRIP_CACHE_MAX_ENTRIES, ttl=TRIP_CACHE_TTL):
+        """Construct an empty cache."""
+        self._entries: OrderedDict[tuple, tuple[datetime, list[Trip]]] = (
+            OrderedDict()
+        )
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(origin, destination, moment: datetime) -> tuple:
+        """Build the key of the connections requested at a moment."""
+        return (origin, destination, time_bucket(moment))
+
+    def get(
+        self, key, now: datetime | None = None, count=0
+    ) -> list[Trip] | None:
+        """Return the cached connections if present and not expired.
+
+        Connections of which fewer than count have not left yet are treated as
+        expired, unless none of them left, i.e. there are no more to request.
+        """
+        now = datetime.now() if now is None else now
+        entry = self._entries.get(key)
+        if entry is None or now - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        upcoming = sum(minutes_until(t.real_departure, now) >= 0 for t in entry[1])
+        if upcoming < min(count, len(entry[1])):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, trips: list[Trip], now: datetime | None = None) -> None:
+        """Store connections, evicting the least recently used entries."""
+        self._entries[key] = (datetime.now() if now is None else now, trips)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, origin, destination) -> None:
+        """Drop all connections between two stops."""
+        for key in [k for k in self._entries if k[:2] == (origin, destination)]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        """Return the size and hit counters of the cache."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class VVMTripMonitor:
+    """The next connections between two stops.
+
+    The trip request is expensive, so connections are served from the shared
+    cache of the current time bucket, or carried over from the previous bucket
+    while enough of them are still ahead. They are only requested again when
+    the departure monitor of a stop where an upcoming ride starts shows a
+    delay that differs from the last one seen for that ride. The departures
+    of those stops come from departure_source, which defaults to requesting
+    them on every update.
+    """
+
+    cache = TripCache()
+    # last delay seen in the departure monitors by ride, shared like the cache
+    observed_delays: dict[tuple, int] = {}
+
+    def __init__(
+        self,
+        origin_id,
+        origin_name,
+        destination_id,
+        destination_name,
+        trip_count=DEFAULT_TRIP_COUNT,
+    ) -> None:
+        """Construct VVMTripMonitor instance."""
+        self.origin_id = origin_id
+        self.origin_name = origin_name
+        self.destination_id = destination_id
+        self.destination_name = destination_name
+        self.trip_count = trip_count
+        self.trips: list[Trip] = []
+        self.stale = False
+        self.last_error = ""
+        self.last_updated: datetime | None = None
+        self.last_planned: datetime | None = None
+        self.trip_requests = 0
+        self.delay_refreshes = 0
+        self.metrics = StopMetrics()
+        self._plan: list[Trip] = []
+        self._stops: dict[str, VVMStopMonitor] = {}
+        self._watched: list[str] = []
+        self.departure_source = self._fetch_departures
+
+    @staticmethod
+    async def get_trip_request(
+        origin_id, destination_id, moment: datetime, count, metrics=None
+    ):
+        """Make a low-level request for the connections leaving after a moment."""
+        base_url = f"{VVMAccessApi.base_url}/XML_TRIP_REQUEST2"
+        params = {
+            "useRealtime": 1,
+            "locationServerActive": "1",
+            "name_origin": origin_id,
+            "type_origin": "stop",
+            "name_destination": destination_id,
+            "type_destination": "stop",
+            "itdDate": moment.strftime("%Y%m%d"),
+            "itdTime": moment.strftime("%H%M"),
+            "itdTripDateTimeDepArr": "dep",
+            "calcNumberOfTrips": f"{count}",
+            "coordOutputFormat": "WGS84[DD.ddddd]",
+            "outputFormat": "json",
+        }
+        return await VVMAccessApi.fetch_data(base_url, params, metrics)
+
+    def _upcoming(self, trips: list[Trip], now: datetime) -> list[Trip]:
+        """Return the connections that did not leave yet."""
+        return [t for t in trips if minutes_until(t.real_departure, now) >= 0]
+
+    async def _plan_trips(self, now: datetime) -> list[Trip]:
+        """Request the connections leaving from now on."""
+        data = await self.get_trip_request(
+            self.origin_id,
+            self.destination_id,
+            now,
+            # one spare for a connection leaving within the current minute
+            self.trip_count + 1,
+            self.metrics,
+        )
+        self.trip_requests += 1
+        self.last_planned = now
+        return parse_trips(data)
+
+    async def _fetch_departures(self, stop_id, timespan, first_left):
+        """Request the departures of a stop, the default departure_source."""
+        if (stop := self._stops.get(stop_id)) is None:
+            stop = self._stops[stop_id] = VVMStopMonitor(stop_id)
+        return await stop.get_stop_departures(timespan)
+
+    async def _delayed_rides(self, trips: list[Trip], now: datetime) -> bool:
+        """Check the departure monitors for new delays of the upcoming rides.
+
+        Only rides starting within TRIP_WATCH_MINUTES are checked, asking
+        departure_source once per stop.
+        """
+        rides: dict[str, list] = {}
+        for trip in trips:
+            for leg in trip.rides:
+                if 0 <= minutes_until(leg.real_departure, now) < TRIP_WATCH_MINUTES:
+                    rides.setdefault(leg.origin_id, []).append(leg)
+
+        delayed = False
+        for stop_id, legs in rides.items():
+            first_left = min(minutes_until(leg.real_departure, now) for leg in legs)
+            try:
+                departures = await self.departure_source(
+                    stop_id, TRIP_WATCH_MINUTES, first_left
+                )
+            except ValueError as e:
+                _LOGGER.debug("Cannot check the delays at %s: %s", stop_id, e)
+                continue
+            by_key = {(d.num, d.should_time): d.delay for d in departures}
+            for leg in legs:
+                delay = by_key.get((leg.num, leg.should_departure))
+                if delay is None:
+                    continue
+                if delay != self.observed_delays.get(leg.key, leg.delay):
+                    delayed = True
+                self.observed_delays[leg.key] = delay
+        # forget the rides that are long gone
+        horizon = now - timedelta(hours=1)
+        for key in [k for k in self.observed_delays if k[2] < horizon]:
+            del self.observed_delays[key]
+        self._stops = {k: v for k, v in self._stops.items() if k in rides}
+        self._watched = list(rides)
+        return delayed
+
+    async def async_update(self) -> bool:
+        """Update the connections.
+
+        Returns False if the published data did not change since the last call.
+        """
+        now = datetime.now()
+        start = perf_counter()
+        key = self.cache.key(self.origin_id, self.destination_id, now)
+        try:
+            plan = self.cache.get(key, now, self.trip_count)
+            upcoming = self._upcoming(self._plan, now)
+            if plan is None and len(upcoming) >= self.trip_count:
+                plan = self._plan
+                self.cache.put(key, plan, now)
+            if plan is not None and await self._delayed_rides(
+                self._upcoming(plan, now)[: self.trip_count], now
+            ):
+                self.delay_refreshes += 1
+                self.cache.invalidate(self.origin_id, self.destination_id)
+                plan = None
+            if plan is None:
+                plan = await self._plan_trips(now)
+                self.cache.put(key, plan, now)
+        except ValueError as e:
+            self.metrics.record_error(e)
+            self.metrics.update_ms.record((perf_counter() - start) * 1000)
+            _LOGGER.debug("Updating the connections failed: %s", error_type(e))
+            changed = not self.stale or self.last_error != f"{e}"
+            self.stale = True
+            self.last_error = f"{e}"
+            return self.refresh_countdowns(now) or changed
+
+        self.last_updated = now
+        changed = self.stale or plan is not self._plan
+        self.stale = False
+        self.last_error = ""
+        self._plan = plan
+        self.metrics.update_ms.record((perf_counter() - start) * 1000)
+        return self.refresh_countdowns(now) or changed
+
+    def refresh_countdowns(self, now=None) -> bool:
+        """Drop the connections that left, without a request.
+
+        Returns False if the published connections did not change.
+        """
+        if now is None:
+            now = datetime.now()
+        trips = self._upcoming(self._plan, now)[: self.trip_count]
+        if len(trips) == len(self.trips) and all(
+            a is b for a, b in zip(trips, self.trips)
+        ):
+            return False
+        self.trips = trips
+        return True
+
+    @property
+    def title(self) -> str:
+        """Return the name of the connection."""
+        return f"{self.origin_name} → {self.destination_name}"
+
+    @property
+    def next_trip(self) -> Trip | None:
+        """Return the next connection."""
+        return self.trips[0] if self.trips else None
+
+    def diagnostics(self) -> dict:
+        """Return the state of the monitor for diagnostics."""
+        return {
+            "origin_id": self.origin_id,
+            "destination_id": self.destination_id,
+            "trips": len(self.trips),
+            "stale": self.stale,
+            "last_error": self.last_error,
+            "last_updated": self.last_updated.isoformat()
+            if self.last_updated is not None
+            else None,
+            "last_planned": self.last_planned.isoformat()
+            if self.last_planned is not None
+            else None,
+            "trip_requests": self.trip_requests,
+            "delay_refreshes": self.delay_refreshes,
+            "watched_stops": self._watched,
+            "metrics": self.metrics.as_dict(),
+            "cache": self.cache.stats(),
+        }
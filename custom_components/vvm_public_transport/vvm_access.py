@@ -1,58 +1,311 @@
 """VVM access module."""
-from datetime import datetime
+import asyncio
+from datetime import datetime, time
 import json
 import logging
+import math
+from time import perf_counter
+from typing import Any, NamedTuple
 
 import aiohttp
 
+from .const import (
+    API_BASE_URL,
+    ATTRIBUTE_MODE_FULL,
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_KEEPALIVE_TIMEOUT,
+    DEFAULT_LIMIT_PER_HOST,
+    DEFAULT_REQUEST_TIMEOUT,
+    DM_LIMIT_HEADROOM,
+    DM_MIN_LIMIT,
+    MAX_RETRIES,
+    NEARBY_FETCH_MAX_RESULTS,
+    PARSE_REUSE_MINUTES,
+    RETRY_BASE_DELAY,
+    STOPFINDER_MAX_RESULTS,
+    V_TYPE_MEANS,
+)
+from .departure import (
+    Departure,
+    minutes_between,
+    minutes_until,
+    parse_efa_datetime,
+)
+from .filters import DepartureFilter, means_params
+from .history import StopDelayHistory
+from .catalog import StopCatalog
+from .lookup_cache import LookupCache, coord_key, name_key
+from .metrics import ApiMetrics, RequestMetrics, StopMetrics
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    TokenBucket,
+    jittered,
+)
+from .response_cache import DepartureResponseCache, covers
+
+try:
+    import brotli  # noqa: F401
+
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+# decoders that accept raw UTF-8 bytes, fastest first
+try:
+    from orjson import loads as json_loads
+
+    JSON_DECODE_ERRORS: tuple = (json.JSONDecodeError, UnicodeDecodeError)
+except ImportError:
+    try:
+        from ujson import JSONDecodeError as UJSONDecodeError, loads as json_loads
+
+        JSON_DECODE_ERRORS = (UJSONDecodeError, UnicodeDecodeError)
+    except ImportError:
+        json_loads = json.loads
+        JSON_DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
 _LOGGER = logging.getLogger(__name__)
 
 
+class Response(NamedTuple):
+    """Decoded payload of a response with its size and decode time."""
+
+    payload: Any
+    size: int
+    decode_ms: float
+
+
 class VVMAccessApi:
     """VVM access API."""
 
+    base_url = API_BASE_URL
+    _session: aiohttp.ClientSession | None = None
+    _session_users = 0
+    _in_flight: dict[tuple, asyncio.Future] = {}
+    _breakers: dict[str, CircuitBreaker] = {}
+    _retry_budget = RetryBudget()
+    _rate_limit = TokenBucket()
+    metrics = ApiMetrics()
+    # means of transport (motType) by vehicle type, for pruning the requests
+    type_means: dict[str, set[str]] = {t: set(m) for t, m in V_TYPE_MEANS.items()}
+    lookup_cache = LookupCache()
+    departure_cache = DepartureResponseCache()
+    stop_catalog = StopCatalog()
+
+    @classmethod
+    def open_session(cls):
+        """Return the shared HTTP session, creating it if needed.
+
+        The session serves all entries, so its connection limit, DNS cache TTL,
+        keep-alive and request timeout are the DEFAULT_* constants rather than
+        options of an entry.
+        """
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                use_dns_cache=True,
+                ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+                keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+            )
+            cls._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+                timeout=aiohttp.ClientTimeout(total=DEFAULT_REQUEST_TIMEOUT),
+            )
+        return cls._session
+
+    @classmethod
+    def acquire_session(cls):
+        """Register a user of the shared HTTP session and return the session."""
+        cls._session_users += 1
+        return cls.open_session()
+
+    @classmethod
+    async def async_release_session(cls):
+        """Unregister a user of the shared HTTP session, closing it after the last."""
+        cls._session_users = max(cls._session_users - 1, 0)
+        if not cls._session_users:
+            await cls.async_close_session()
+
+    @classmethod
+    async def async_close_session(cls):
+        """Close the shared HTTP session."""
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
     @staticmethod
-    async def fetch_data(url, params):
-        """Make an async HTTP request with given url and parameters."""
+    def request_key(url, params):
+        """Build a normalized key identifying a request."""
+        return (url, tuple(sorted((str(k), str(v)) for k, v in params.items())))
+
+    @classmethod
+    async def fetch_data(cls, url, params, metrics: RequestMetrics | None = None):
+        """Make an async HTTP request with given url and parameters.
+
+        Concurrent identical requests are coalesced into a single one and all
+        callers get the same decoded payload, so it must not be modified.
+        Successful responses are accounted in the given metrics with the
+        latency seen by the caller.
+        """
+        start = perf_counter()
+        endpoint = cls.metrics.endpoint(url)
+        endpoint.calls += 1
+        key = cls.request_key(url, params)
+        task = cls._in_flight.get(key)
+        if task is not None:
+            endpoint.coalesced += 1
+        else:
+            task = asyncio.ensure_future(cls._fetch_data(url, params))
+            cls._in_flight[key] = task
+
+            def _request_done(t):
+                cls._in_flight.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_request_done)
+        response = await asyncio.shield(task)
+        if metrics is not None:
+            metrics.record_response(
+                (perf_counter() - start) * 1000,
+                response.size,
+                response.decode_ms,
+            )
+        return response.payload
+
+    @classmethod
+    def breaker(cls, url) -> CircuitBreaker:
+        """Return the circuit breaker of an endpoint."""
+        if (breaker := cls._breakers.get(url)) is None:
+            breaker = cls._breakers[url] = CircuitBreaker()
+        return breaker
+
+    @classmethod
+    def breaker_states(cls) -> dict:
+        """Return the state of the circuit breakers by endpoint."""
+        return {
+            url.rsplit("/", 1)[-1]: {
+                "state": breaker.state,
+                "retry_after": breaker.retry_after,
+            }
+            for url, breaker in cls._breakers.items()
+        }
+
+    @classmethod
+    async def _fetch_data(cls, url, params):
+        """Perform the request through the endpoint's circuit breaker.
+
+        Failed requests are retried with a jittered exponential backoff as long
+        as the retry budget allows it. Every attempt takes a token of the
+        global rate limit.
+        """
+        breaker = cls.breaker(url)
+        endpoint = cls.metrics.endpoint(url)
+        if not breaker.allow_request():
+            error = CircuitOpenError(
+                f"Requests to {url} are suspended for"
+                f" {breaker.retry_after:.0f}s after repeated failures"
+            )
+            endpoint.record_error(error)
+            raise error
+        cls._retry_budget.deposit()
+        attempt = 0
         try:
-            async with aiohttp.ClientSession() as session, session.get(
-                url, params=params
-            ) as response:
+            while True:
+                await cls._rate_limit.acquire()
+                try:
+                    result = await cls._request(url, params)
+                except ValueError as e:
+                    endpoint.record_error(e)
+                    if attempt < MAX_RETRIES and cls._retry_budget.withdraw():
+                        await asyncio.sleep(jittered(RETRY_BASE_DELAY * 2**attempt))
+                        attempt += 1
+                        continue
+                    breaker.record_failure()
+                    raise
+                breaker.record_success()
+                return result
+        except BaseException:
+            # a cancelled or crashed probe must not keep the endpoint blocked
+            breaker.release_probe()
+            raise
+
+    @classmethod
+    async def _request(cls, url, params) -> Response:
+        """Perform the actual HTTP request."""
+        session = cls.open_session()
+        start = perf_counter()
+        try:
+            async with session.get(url, params=params) as response:
                 if response.status == 200:
-                    resp_text = await response.text()
-                    dec = resp_text
-                    return json.loads(dec)
+                    body = await response.read()
+                    received = perf_counter()
+                    charset = response.charset
+                    if charset is not None and charset.lower() not in (
+                        "utf-8",
+                        "utf8",
+                    ):
+                        payload = json_loads(body.decode(charset))
+                    else:
+                        payload = json_loads(body)
+                    decode_ms = (perf_counter() - received) * 1000
+                    cls.metrics.endpoint(url).record_response(
+                        (received - start) * 1000, len(body), decode_ms
+                    )
+                    return Response(payload, len(body), decode_ms)
+        except asyncio.TimeoutError as e:
+            _LOGGER.error("VVM request to %s timed out", url)
+            raise ValueError(f"Request to {url} timed out") from e
         except aiohttp.ClientError as e:
             e_desc = f"Failed to retrieve data VVM request to {url}; Error: {e}"
             _LOGGER.error(e_desc)
             raise ValueError(f"Got connection error: {e}") from e
-        except json.JSONDecodeError as e:
+        except JSON_DECODE_ERRORS as e:
             e_desc = (
                 f"Got response that could not be decoded to JSON: {url}; Error: {e}"
             )
             _LOGGER.error(e_desc)
             raise ValueError(f"Got json error: {e}") from e
+        except LookupError as e:
+            # the response declared a charset Python does not know
+            _LOGGER.error("Could not decode the response of %s: %s", url, e)
+            raise ValueError(f"Got decoding error: {e}") from e
         raise ValueError(f"Failed to execute a request to {url}")
 
     @staticmethod
     async def get_stop_list(keyword):
         """Obtain list of stops based on the passed keyword."""
-        base_url = "https://mobile.defas-fgi.de/vvmapp/XML_STOPFINDER_REQUEST"
+        cache = VVMAccessApi.lookup_cache
+        key = name_key(keyword)
+        if (cached := cache.get(key)) is not None:
+            return cached
+        if (cached := cache.find_by_prefix(keyword)) is not None:
+            return cached
+
+        base_url = f"{VVMAccessApi.base_url}/XML_STOPFINDER_REQUEST"
         params = {
             "name_sf": keyword,
             "regionID_sf": "1",
             "type_sf": "any",
+            "anyMaxSizeHitList": f"{STOPFINDER_MAX_RESULTS}",
+            "coordOutputFormat": "WGS84[DD.ddddd]",
             "outputFormat": "json",
         }
 
         try:
             data = await VVMAccessApi.fetch_data(base_url, params)
         except ValueError:
-            return []
+            return cache.get(key, allow_expired=True) or []
 
         result = []
+        complete = False
         if "stopFinder" in data:
             points = data["stopFinder"].get("points", [])
+            # a full hit list may have been cut off
+            complete = len(points) < STOPFINDER_MAX_RESULTS
             for p in points:
                 if (
                     p["type"] == "any"
@@ -63,9 +316,27 @@ class VVMAccessApi:
                     i = {}
                     i["name"] = p["name"]
                     i["id"] = p["stateless"]
+                    VVMAccessApi.add_coords(i, p.get("ref", {}).get("coords"))
                     result.append(i)
+        if result:
+            cache.put(key, result, complete)
+            VVMAccessApi.stop_catalog.add_stops(result)
+            if complete:
+                VVMAccessApi.stop_catalog.add_searched_keyword(keyword)
         return result
 
+    @staticmethod
+    def add_coords(stop, coords):
+        """Add lat/lon to a stop from an EFA 'lon,lat' WGS84 coordinate string."""
+        if not coords:
+            return
+        try:
+            lon, lat = (float(x) for x in coords.split(","))
+        except ValueError:
+            return
+        stop["lat"] = lat
+        stop["lon"] = lon
+
     @staticmethod
     def try_find_name(p):
         """Try finding the name among the attributes."""
@@ -76,15 +347,22 @@ class VVMAccessApi:
         return None
 
     @staticmethod
-    async def get_stops_nearby(lat, lon, radius=500):
+    async def get_stops_nearby(
+        lat, lon, radius=500, max_results=NEARBY_FETCH_MAX_RESULTS
+    ):
         """Obtain list of stops based on the passed coordinates and radius."""
         # https://mobile.defas-fgi.de/vvmapp/XML_COORD_REQUEST?
         # coord=9.999999999999999:49.11111111111111:WGS84[DD.ddddd]&max=10&inclFilter=1&radius_1=500
         # &type_1=STOP&stateless=1&language=en&outputFormat=XML&coordOutputFormat=WGS84[DD.ddddd]&coordOutputFormatTail=7
-        base_url = "https://mobile.defas-fgi.de/vvmapp/XML_COORD_REQUEST"
+        cache = VVMAccessApi.lookup_cache
+        key = coord_key(lat, lon, radius, max_results)
+        if (cached := cache.get(key)) is not None:
+            return cached
+
+        base_url = f"{VVMAccessApi.base_url}/XML_COORD_REQUEST"
         params = {
             "coord": f"{lon}:{lat}:WGS84[DD.ddddd]",
-            "max": "10",
+            "max": f"{max_results}",
             "inclFilter": "1",
             "radius_1": f"{radius}",
             "type_1": "STOP",
@@ -98,7 +376,7 @@ class VVMAccessApi:
         try:
             data = await VVMAccessApi.fetch_data(base_url, params)
         except ValueError:
-            return []
+            return cache.get(key, allow_expired=True) or []
         result = []
         if "pins" in data:
             points = data["pins"]
@@ -107,11 +385,16 @@ class VVMAccessApi:
                     i = {}
                     i["id"] = p["id"]
                     i["name"] = VVMAccessApi.try_find_name(p)
-                    if i["name"] is None and "desc" in p:
-                        i["name"] = p["desc"]
-                    else:
-                        i["name"] = "Unknown Stop Name"
+                    if i["name"] is None:
+                        i["name"] = p.get("desc", "Unknown Stop Name")
+                    VVMAccessApi.add_coords(i, p.get("coords"))
                     result.append(i)
+        if result:
+            cache.put(key, result)
+        catalog = VVMAccessApi.stop_catalog
+        catalog.add_stops(result)
+        if len(result) < max_results:
+            catalog.add_covered_area(float(lat), float(lon), radius)
         return result
 
 
@@ -119,15 +402,38 @@ class VVMStopMonitor:
     """VVM stop monitoring class."""
 
     stop_id: str
+    payload_changed: bool
+    # attached monitors by stop id, their requests are pruned alike
+    _peers: dict[str, list["VVMStopMonitor"]] = {}
 
     def __init__(self, stop_id):
         """Contstruct VVMStopMonitor instance."""
         self.stop_id = stop_id
+        self.payload_changed = True
+        self._fingerprint = None
+        self._parsed: list[Departure] = []
+        self._parsed_at: datetime | None = None
+        self._parsed_timespan = None
+        self._last_result: list[Departure] = []
+        self._last_result_at: datetime | None = None
+        self._last_result_timespan = None
+        self.metrics = StopMetrics()
+        self._prune_types: frozenset[str] = frozenset()
+        self._limit: int | None = None
+        self._fetched_pruning: dict[str, str] = {}
 
     @staticmethod
-    async def get_departure_monitor_request(stop_id):
-        """Make a low-level request to retrieve realtime departures for a given stop."""
-        base_url = "https://mobile.defas-fgi.de/vvmapp/XML_DM_REQUEST"
+    async def get_departure_monitor_request(stop_id, metrics=None, pruning=None):
+        """Make a low-level request to retrieve realtime departures for a given stop.
+
+        The optional pruning parameters narrow the response down server-side.
+        Recent responses of the stop are shared, see DepartureResponseCache.
+        """
+        pruning = pruning or {}
+        cache = VVMAccessApi.departure_cache
+        if (payload := cache.get(stop_id, pruning)) is not None:
+            return payload
+        base_url = f"{VVMAccessApi.base_url}/XML_DM_REQUEST"
         params = {
             "useRealtime": 1,
             "mode": "direct",
@@ -138,8 +444,91 @@ class VVMStopMonitor:
             "maxTimeLoop": "2",
             "outputFormat": "json",
         }
+        params.update(pruning)
+
+        payload = await VVMAccessApi.fetch_data(base_url, params, metrics)
+        cache.put(stop_id, pruning, payload)
+        return payload
+
+    def attach(self) -> None:
+        """Share the pruning of the requests with the other monitors of the stop.
+
+        Monitors of the same stop then send identical requests, which are
+        coalesced into one.
+        """
+        peers = self._peers.setdefault(self.stop_id, [])
+        if self not in peers:
+            peers.append(self)
+
+    def detach(self) -> None:
+        """Stop sharing the pruning of the requests."""
+        peers = self._peers.get(self.stop_id, [])
+        if self in peers:
+            peers.remove(self)
+        if not peers:
+            self._peers.pop(self.stop_id, None)
+
+    @property
+    def prune_types(self) -> frozenset[str]:
+        """Access the vehicle types the requests are restricted to."""
+        return self._prune_types
+
+    @prune_types.setter
+    def prune_types(self, types):
+        """Restrict the requests to vehicle types, all of them if empty."""
+        types = frozenset(types)
+        if types != self._prune_types:
+            self._prune_types = types
+            # the limit was sized for the departures of the previous types
+            self._limit = None
+
+    def request_params(self) -> dict[str, str]:
+        """Return the parameters pruning the departure request server-side.
 
-        return await VVMAccessApi.fetch_data(base_url, params)
+        The response is restricted to the means of transport of the type
+        filter and limited to a bit more departures than the last response
+        had within the horizon. The filters are still applied client-side.
+        Attached monitors of the stop request the union of their types and
+        the largest of their limits.
+        """
+        peers = self._peers.get(self.stop_id, [])
+        if self not in peers:
+            peers = [self]
+        if all(p.prune_types for p in peers):
+            types = frozenset().union(*(p.prune_types for p in peers))
+        else:
+            types = frozenset()
+        params = means_params(types, VVMAccessApi.type_means)
+        limits = [p._limit for p in peers]  # pylint: disable=protected-access
+        if None not in limits:
+            params["limit"] = f"{max(limits)}"
+        return params
+
+    def has_types(self, types) -> bool:
+        """Check if the parsed departures include all departures of the types.
+
+        Departures of types the last request was not restricted to have to be
+        fetched before a widened type filter can be applied locally.
+        """
+        wanted = means_params(frozenset(types), VVMAccessApi.type_means)
+        return self.has_departures and covers(self._fetched_pruning, wanted)
+
+    def has_timespan(self, timespan) -> bool:
+        """Check if the parsed departures reach as far as the timespan."""
+        return self._parsed_timespan is not None and timespan <= self._parsed_timespan
+
+    @staticmethod
+    def is_truncated(deps, limit, horizon) -> bool:
+        """Check if the limit may have cut off departures within the horizon.
+
+        A shared response may have been requested with a higher limit, so the
+        departure at the limit is checked rather than the last one.
+        """
+        if len(deps) < limit:
+            return False
+        last = deps[limit - 1]
+        delay = max(int(last.get("servingLine", {}).get("delay", "0")), 0)
+        return int(last["countdown"]) - delay < horizon
 
     @staticmethod
     async def is_stop_id_valid(stop_id):
@@ -171,60 +560,167 @@ class VVMStopMonitor:
                 return (False, err_code, err_msg)
         return (False, err_code, err_msg)
 
+    @staticmethod
+    def departures_fingerprint(deps, horizon):
+        """Fingerprint departures within the horizon, leaving out the countdown."""
+        items = []
+        for d in deps:
+            if "servingLine" not in d:
+                continue
+            sl = d["servingLine"]
+            if int(d["countdown"]) - max(int(sl.get("delay", "0")), 0) >= horizon:
+                break
+            items.append(
+                (
+                    sl.get("stateless"),
+                    sl.get("key"),
+                    sl.get("number"),
+                    sl.get("direction"),
+                    sl.get("delay"),
+                    tuple(d.get("dateTime", {}).values()),
+                    tuple(d["realDateTime"].values()) if "realDateTime" in d else None,
+                )
+            )
+        return hash(tuple(items))
+
     async def get_stop_departures(self, timespan=30):
-        """Retrieve the current departures for a stop of the current instance."""
-        data = await self.get_departure_monitor_request(self.stop_id)
+        """Retrieve the current departures for a stop of the current instance.
+
+        When the payload matches the previous one apart from the countdowns, the
+        previously parsed departures are reused with locally adjusted countdowns
+        and payload_changed is set to False.
+        """
+        horizon = timespan + PARSE_REUSE_MINUTES
+        pruning = self.request_params()
+        data = await self.get_departure_monitor_request(
+            self.stop_id, self.metrics, pruning
+        )
+        deps = data.get("departureList")
+        if (
+            "limit" in pruning
+            and isinstance(deps, list)
+            and self.is_truncated(deps, int(pruning["limit"]), horizon)
+        ):
+            # more departures than expected, repeat without the limit
+            self._limit = None
+            del pruning["limit"]
+            data = await self.get_departure_monitor_request(
+                self.stop_id, self.metrics, pruning
+            )
+            deps = data.get("departureList")
+        now = datetime.now()
+        # the limit only cuts off departures beyond the horizon
+        self._fetched_pruning = {k: v for k, v in pruning.items() if k != "limit"}
+        if not isinstance(deps, list):
+            self.payload_changed = True
+            self._fingerprint = None
+            self._set_parsed([], now, timespan)
+            return self.departures_at(now, timespan)
+
+        fingerprint = self.departures_fingerprint(deps, horizon)
+        if (
+            fingerprint == self._fingerprint
+            and timespan == self._parsed_timespan
+            and minutes_between(self._parsed_at, now) < PARSE_REUSE_MINUTES
+        ):
+            self.payload_changed = False
+            self.metrics.parse_reused += 1
+        else:
+            self.payload_changed = True
+            self._fingerprint = fingerprint
+            start = perf_counter()
+            parsed = self._parse_departures(deps, horizon)
+            self.metrics.parse_ms.record((perf_counter() - start) * 1000)
+            self.metrics.parse_full += 1
+            self._set_parsed(parsed, now, timespan)
+        self._limit = max(
+            DM_MIN_LIMIT, math.ceil(len(self._parsed) * DM_LIMIT_HEADROOM)
+        )
+        return self.departures_at(now, timespan)
+
+    @property
+    def has_departures(self):
+        """Check if any departures were retrieved yet."""
+        return self._parsed_at is not None
+
+    def _set_parsed(self, parsed, now, timespan):
+        """Store freshly parsed departures."""
+        self._parsed = parsed
+        self._parsed_at = now
+        self._parsed_timespan = timespan
+        self._last_result_at = None
+
+    def departures_at(self, now, timespan):
+        """Return the last parsed departures with countdowns shifted to now.
+
+        Departures that already left are dropped. Within the same minute the
+        very same list object is returned.
+        """
+        if self._parsed_at is None:
+            return []
+        if (
+            self._last_result_at is not None
+            and self._last_result_timespan == timespan
+            and minutes_between(self._last_result_at, now) == 0
+        ):
+            return self._last_result
+        elapsed = minutes_between(self._parsed_at, now)
+        if elapsed == 0:
+            result = [i for i in self._parsed if i.left < timespan]
+        else:
+            result = [
+                i.with_left(i.left - elapsed)
+                for i in self._parsed
+                if 0 <= i.left - elapsed < timespan
+            ]
+        self._last_result = result
+        self._last_result_at = now
+        self._last_result_timespan = timespan
+        return result
+
+    @staticmethod
+    def _parse_departures(deps, horizon):
+        """Parse raw departures leaving within the horizon in minutes.
+
+        The list is ordered by the scheduled time, so parsing stops at the first
+        departure that was already scheduled beyond the horizon.
+        """
         result = []
-        if "departureList" in data:
-            deps = data["departureList"]
-            if not isinstance(deps, list):
-                return result
-            for d in deps:
-                if "servingLine" not in d:
-                    continue
-                countdown = int(d["countdown"])
-                if countdown < timespan:
-                    i = {}
-                    i["left"] = countdown
-                    i["delay"] = int(d["servingLine"].get("delay", "0"))
-                    i["type"] = d["servingLine"].get("name", "???")
-                    i["num"] = d["servingLine"].get("number", "???")
-                    i["to"] = d["servingLine"]["direction"]
-                    i["from"] = d["servingLine"]["directionFrom"]
-                    dt = d["dateTime"]
-                    i["should_time"] = datetime(
-                        int(dt["year"]),
-                        int(dt["month"]),
-                        int(dt["day"]),
-                        int(dt["hour"]),
-                        int(dt["minute"]),
-                    )
-                    h = dt["hour"]
-                    if len(h) == 1:
-                        h = "0" + h
-                    m = dt["minute"]
-                    if len(m) == 1:
-                        m = "0" + m
-                    i["should_time_simple"] = h + ":" + m
-
-                    if "realDateTime" in d:
-                        dt = d["realDateTime"]
-
-                    i["real_time"] = datetime(
-                        int(dt["year"]),
-                        int(dt["month"]),
-                        int(dt["day"]),
-                        int(dt["hour"]),
-                        int(dt["minute"]),
-                    )
-                    h = dt["hour"]
-                    if len(h) == 1:
-                        h = "0" + h
-                    m = dt["minute"]
-                    if len(m) == 1:
-                        m = "0" + m
-                    i["real_time_simple"] = h + ":" + m
-                    result.append(i)
+        dt_cache: dict = {}
+        type_means = VVMAccessApi.type_means
+        for d in deps:
+            if "servingLine" not in d:
+                continue
+            sl = d["servingLine"]
+            countdown = int(d["countdown"])
+            delay = int(sl.get("delay", "0"))
+            if countdown >= horizon:
+                if countdown - max(delay, 0) >= horizon:
+                    break
+                continue
+            should_time = parse_efa_datetime(d["dateTime"], dt_cache)
+            if "realDateTime" in d:
+                real_time = parse_efa_datetime(d["realDateTime"], dt_cache)
+            else:
+                real_time = should_time
+            key = sl.get("key")
+            vehicle_type = sl.get("name", "???")
+            if (mot := sl.get("motType")) is not None:
+                type_means.setdefault(vehicle_type, set()).add(mot)
+            result.append(
+                Departure(
+                    countdown,
+                    delay,
+                    vehicle_type,
+                    sl.get("number", "???"),
+                    sl["direction"],
+                    sl["directionFrom"],
+                    d.get("platform", ""),
+                    should_time,
+                    real_time,
+                    f"{sl.get('stateless', '')}#{key}" if key else "",
+                )
+            )
         return result
 
 
@@ -233,8 +729,8 @@ class VVMStopMonitorHA:
 
     api: VVMStopMonitor
     timespan: int
-    departures: list[dict]
-    last_updated: datetime
+    departures: list[Departure]
+    last_updated: datetime | None
     last_updated_simple: str
     stale: bool
     last_error: str
@@ -245,6 +741,10 @@ class VVMStopMonitorHA:
     nearest_vehicle_num: str
     _filters: dict
     _stop_name: str
+    attribute_mode: str
+    delay_history: StopDelayHistory | None
+    _quiet_hours: tuple[time, time] | None
+    _compiled_filter: DepartureFilter | None
 
     def __init__(self, stop_id, stop_name, timespan=30):
         """Construct VVMStopMonitorHA instance."""
@@ -252,65 +752,142 @@ class VVMStopMonitorHA:
         self.timespan = timespan
         self._filters = {}
         self._stop_name = stop_name
+        self._quiet_hours = None
+        self._last_deps = None
+        self._last_filter = None
+        self._compiled_filter = None
+        self.attribute_mode = ATTRIBUTE_MODE_FULL
+        self.delay_history = None
         self.stale = False
         self.last_error = ""
+        self.last_updated = None
         self.last_updated_simple = "XX:XX"
+        self.departures = []
+        self._update_nearest()
+
+    @property
+    def compiled_filter(self) -> DepartureFilter:
+        """Access the filter compiled from the current filter values."""
+        if self._compiled_filter is None:
+            self._compiled_filter = DepartureFilter(
+                self.filter_types,
+                self.filter_nums,
+                self.filter_direction,
+                self.filter_platform,
+            )
+        return self._compiled_filter
 
     def filter_departure_in(self, d):
         """Filter departure in if it fits."""
-        if "types" in self._filters and len(self._filters["types"]) > 0:
-            if len([t for t in self._filters["types"] if t == d["type"]]) == 0:
-                return False
-        if "numbers" in self._filters and len(self._filters["numbers"]) > 0:
-            if (
-                len(
-                    [
-                        t
-                        for t in self._filters["numbers"]
-                        if t.strip().lower() == d["num"].lower()
-                    ]
-                )
-                == 0
-            ):
-                return False
-        if "direction" in self._filters and len(self._filters["direction"]) > 0:
-            if (
-                len(
-                    [
-                        t
-                        for t in self._filters["direction"]
-                        if d["to"].lower().find(t.lower()) != -1
-                    ]
-                )
-                == 0
-            ):
-                return False
-
-        return True
+        return self.compiled_filter.matches(d)
 
     async def async_update(self):
-        """Update departures async."""
+        """Update departures async.
+
+        Returns False if the published data did not change since the last call.
+        """
+        metrics = self.api.metrics
+        start = perf_counter()
         try:
             deps = await self.api.get_stop_departures(self.timespan)
         except ValueError as e:
+            metrics.record_error(e)
+            metrics.update_ms.record((perf_counter() - start) * 1000)
+            # keep serving the last good departures with local countdowns
+            changed = not self.stale or self.last_error != f"{e}"
             self.stale = True
             self.last_error = f"{e}"
-            return
+            return self.refresh_countdowns() or changed
 
-        self.stale = False
-        self.last_error = ""
-        self.departures = [d for d in deps if self.filter_departure_in(d)]
         self.last_updated = datetime.now()
         self.last_updated_simple = self.last_updated.strftime("%H:%M")
+        if self.delay_history is not None:
+            self.delay_history.observe(deps, self.last_updated)
+        departure_filter = self.compiled_filter
+        if (
+            not self.stale
+            and deps is self._last_deps
+            and departure_filter is self._last_filter
+        ):
+            metrics.update_ms.record((perf_counter() - start) * 1000)
+            return False
+        self._last_deps = deps
+        self._last_filter = departure_filter
+
+        self.stale = False
+        self.last_error = ""
+        self.departures = [d for d in deps if departure_filter.matches(d)]
+        self._update_nearest()
+        metrics.departures_received = len(deps)
+        metrics.departures_shown = len(self.departures)
+        metrics.update_ms.record((perf_counter() - start) * 1000)
+        return True
+
+    def refilter(self, now=None) -> bool | None:
+        """Apply the current filters to the last fetched departures.
+
+        Returns None if the departures needed by the filters or the timespan
+        were not fetched, so a request is required, otherwise False if the
+        published data did not change.
+        """
+        api = self.api
+        if not (api.has_types(self.filter_types) and api.has_timespan(self.timespan)):
+            return None
+        if now is None:
+            now = datetime.now()
+        departure_filter = self.compiled_filter
+        deps = self.api.departures_at(now, self.timespan)
+        if deps is self._last_deps and departure_filter is self._last_filter:
+            return False
+        self._last_deps = deps
+        self._last_filter = departure_filter
+        departures = [d for d in deps if departure_filter.matches(d)]
+        self.api.metrics.departures_shown = len(departures)
+        if departures == self.departures:
+            return False
+        self.departures = departures
+        self._update_nearest()
+        return True
+
+    def refresh_countdowns(self, now=None):
+        """Recompute the countdowns locally, without a request.
+
+        Returns False if the published data did not change.
+        """
+        if now is None:
+            now = datetime.now()
+        if self.api.has_departures:
+            deps = self.api.departures_at(now, self.timespan)
+            if deps is self._last_deps:
+                return False
+            self._last_deps = deps
+            departures = [d for d in deps if self.compiled_filter.matches(d)]
+        else:
+            # restored from a snapshot, derive countdowns from the departure times
+            departures = []
+            for d in self.departures:
+                left = minutes_until(d.real_time, now)
+                if 0 <= left < self.timespan:
+                    departures.append(d if left == d.left else d.with_left(left))
+        if [(d.left, d.real_time, d.num) for d in departures] == [
+            (d.left, d.real_time, d.num) for d in self.departures
+        ]:
+            return False
+        self.departures = departures
+        self._update_nearest()
+        return True
+
+    def _update_nearest(self):
+        """Update the nearest departure summary from the departures."""
         if len(self.departures) > 0:
             closest = self.departures[0]
             self.nearest_summary = "({:d} min) {} {} ({})".format(
-                closest["left"], closest["type"], closest["num"], closest["to"]
+                closest.left, closest.type, closest.num, closest.to
             )
-            self.nearest_left_minutes = closest["left"]
-            self.nearest_delay_minutes = closest["delay"]
-            self.nearest_vehicle_type = closest["type"]
-            self.nearest_vehicle_num = closest["num"]
+            self.nearest_left_minutes = closest.left
+            self.nearest_delay_minutes = closest.delay
+            self.nearest_vehicle_type = closest.type
+            self.nearest_vehicle_num = closest.num
         else:
             self.nearest_summary = "Unknown"
             self.nearest_left_minutes = 0
@@ -318,6 +895,53 @@ class VVMStopMonitorHA:
             self.nearest_vehicle_type = "Unknown"
             self.nearest_vehicle_num = "Unknown"
 
+    def as_snapshot(self) -> dict:
+        """Return a compact snapshot of the current state for persisting."""
+        return {
+            "departures": [d.as_compact() for d in self.departures],
+            "filters": self._filters,
+            "last_updated": self.last_updated.isoformat()
+            if self.last_updated is not None
+            else None,
+            "last_error": self.last_error,
+        }
+
+    def restore_snapshot(self, data: dict) -> bool:
+        """Restore the state from a snapshot, marking it as stale.
+
+        Countdowns are derived from the stored realtime departure times and
+        departures that already left are dropped.
+        """
+        try:
+            departures = [Departure.from_compact(d) for d in data["departures"]]
+            last_updated = data.get("last_updated")
+            if last_updated is not None:
+                last_updated = datetime.fromisoformat(last_updated)
+        except (KeyError, TypeError, ValueError) as e:
+            _LOGGER.warning(
+                "Ignoring invalid snapshot of stop %s: %s", self.stop_id, e
+            )
+            return False
+
+        filters = data.get("filters", {})
+        if "types" in filters:
+            self.filter_types = filters["types"]
+        if "numbers" in filters:
+            self.filter_nums = filters["numbers"]
+        if "direction" in filters:
+            self.filter_direction = filters["direction"]
+        if "platform" in filters:
+            self.filter_platform = filters["platform"]
+
+        self.departures = [d for d in departures if 0 <= d.left < self.timespan]
+        self.last_updated = last_updated
+        if last_updated is not None:
+            self.last_updated_simple = last_updated.strftime("%H:%M")
+        self.stale = True
+        self.last_error = data.get("last_error", "")
+        self._update_nearest()
+        return True
+
     @property
     def stop_name(self):
         """Access stop name as a property."""
@@ -328,6 +952,40 @@ class VVMStopMonitorHA:
         """Access stop id as a property."""
         return self.api.stop_id
 
+    @property
+    def quiet_hours(self):
+        """Access quiet hours as a (start, end) tuple if they are set."""
+        return self._quiet_hours
+
+    @quiet_hours.setter
+    def quiet_hours(self, v):
+        """Set quiet hours, either as a tuple or as a 'HH:MM-HH:MM' string."""
+        if isinstance(v, str):
+            v = v.strip()
+            if v in ("*", ""):
+                self._quiet_hours = None
+                return
+            try:
+                start, end = (
+                    datetime.strptime(x.strip(), "%H:%M").time() for x in v.split("-")
+                )
+            except ValueError:
+                _LOGGER.warning("Ignoring invalid quiet hours '%s'", v)
+                self._quiet_hours = None
+            else:
+                self._quiet_hours = (start, end)
+        else:
+            self._quiet_hours = v
+
+    def _set_filter(self, key, values):
+        """Store filter values, dropping the compiled filter if they changed."""
+        values = list(values)
+        if self._filters.get(key) != values:
+            self._filters[key] = values
+            self._compiled_filter = None
+            if key == "types":
+                self.api.prune_types = values
+
     @property
     def filter_types(self):
         """Access filter types if they exist."""
@@ -338,7 +996,7 @@ class VVMStopMonitorHA:
     @filter_types.setter
     def filter_types(self, types):
         """Set filter types."""
-        self._filters["types"] = types
+        self._set_filter("types", types)
 
     @property
     def filter_nums(self):
@@ -353,11 +1011,10 @@ class VVMStopMonitorHA:
         if isinstance(v, str):
             v = v.strip()
             if v not in ("*", ""):
-                self._filters["numbers"] = [x.lower().strip() for x in v.split(",")]
+                v = [x.lower().strip() for x in v.split(",")]
             else:
-                self._filters["numbers"] = []
-        else:
-            self._filters["numbers"] = v
+                v = []
+        self._set_filter("numbers", v)
 
     @property
     def filter_direction(self):
@@ -372,8 +1029,25 @@ class VVMStopMonitorHA:
         if isinstance(d, str):
             d = d.strip()
             if d not in ("*", ""):
-                self._filters["direction"] = [x.lower().strip() for x in d.split(",")]
+                d = [x.lower().strip() for x in d.split(",")]
             else:
-                self._filters["direction"] = []
-        else:
-            self._filters["direction"] = d
+                d = []
+        self._set_filter("direction", d)
+
+    @property
+    def filter_platform(self):
+        """Access filter platform if it exist."""
+        if "platform" not in self._filters:
+            self._filters["platform"] = []
+        return self._filters["platform"]
+
+    @filter_platform.setter
+    def filter_platform(self, p):
+        """Set filter platform."""
+        if isinstance(p, str):
+            p = p.strip()
+            if p not in ("*", ""):
+                p = [x.lower().strip() for x in p.split(",")]
+            else:
+                p = []
+        self._set_filter("platform", p)
@@ -0,0 +1,132 @@
+"""Websocket API pushing departure deltas to the timetable card."""
+from __future__ import annotations
+
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import (
+    DOMAIN,
+    SIGNAL_STOP_ADDED,
+    SIGNAL_STOP_REMOVED,
+    STREAM_DEPARTURE_FIELDS,
+)
+from .deltas import DepartureDeltas
+from .vvm_access import VVMStopMonitorHA
+
+WS_SUBSCRIBE_DEPARTURES = f"{DOMAIN}/subscribe_departures"
+
+
+@callback
+def async_register_websocket_commands(hass: HomeAssistant) -> None:
+    """Register the websocket commands of the integration."""
+    websocket_api.async_register_command(hass, ws_subscribe_departures)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): WS_SUBSCRIBE_DEPARTURES,
+        vol.Required("entity_ids"): vol.All(cv.ensure_list, [cv.entity_id]),
+    }
+)
+@callback
+def ws_subscribe_departures(
+    hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict
+) -> None:
+    """Subscribe to the departures of the stops of the given entities.
+
+    Every stop first gets an event with all its departures and "reset" set,
+    then events with the departures that were added or changed ("upsert"),
+    the keys of the ones that are gone ("remove") and the new order of the
+    keys if it changed ("order"). Rows are lists of STREAM_DEPARTURE_FIELDS.
+    """
+    coordinators = hass.data.get(DOMAIN, {})
+    if not coordinators:
+        connection.send_error(
+            msg["id"], websocket_api.ERR_NOT_FOUND, "No VVM stop is loaded"
+        )
+        return
+    registry = er.async_get(hass)
+    entity_by_entry: dict[str, str] = {}
+    for entity_id in msg["entity_ids"]:
+        entity = registry.async_get(entity_id)
+        if entity is None or entity.config_entry_id not in coordinators:
+            connection.send_error(
+                msg["id"],
+                websocket_api.ERR_NOT_FOUND,
+                f"{entity_id} is not a sensor of a loaded VVM stop",
+            )
+            return
+        entity_by_entry[entity.config_entry_id] = entity_id
+
+    unsub_stops: dict[str, Any] = {}
+
+    @callback
+    def async_attach(entry_id, coordinator) -> None:
+        """Push the changes of a stop, starting with all its departures."""
+        if entry_id not in entity_by_entry:
+            return
+        if (unsub := unsub_stops.pop(entry_id, None)) is not None:
+            unsub()
+        deltas = DepartureDeltas()
+        last_meta = None
+
+        @callback
+        def async_send(delta: dict | None) -> None:
+            nonlocal last_meta
+            monitor: VVMStopMonitorHA = coordinator.data
+            meta = {
+                "stop_name": monitor.stop_name,
+                "stale": monitor.stale,
+                "last_updated_simple": monitor.last_updated_simple,
+            }
+            if delta is None and meta == last_meta:
+                return
+            last_meta = meta
+            connection.send_message(
+                websocket_api.event_message(
+                    msg["id"],
+                    {"entity_id": entity_by_entry[entry_id], **meta, **(delta or {})},
+                )
+            )
+
+        @callback
+        def async_stop_updated() -> None:
+            async_send(deltas.update(coordinator.data.departures))
+
+        unsub_stops[entry_id] = coordinator.async_add_listener(async_stop_updated)
+        async_send(
+            {
+                **deltas.reset(coordinator.data.departures),
+                "fields": STREAM_DEPARTURE_FIELDS,
+            }
+        )
+
+    @callback
+    def async_detach(entry_id) -> None:
+        """Stop pushing the changes of an unloaded stop."""
+        if (unsub := unsub_stops.pop(entry_id, None)) is not None:
+            unsub()
+
+    unsub_signals = [
+        async_dispatcher_connect(hass, SIGNAL_STOP_ADDED, async_attach),
+        async_dispatcher_connect(hass, SIGNAL_STOP_REMOVED, async_detach),
+    ]
+
+    @callback
+    def async_unsubscribe() -> None:
+        """Drop all listeners of the subscription."""
+        for unsub in [*unsub_signals, *unsub_stops.values()]:
+            unsub()
+        unsub_stops.clear()
+
+    connection.subscriptions[msg["id"]] = async_unsubscribe
+    connection.send_result(msg["id"])
+    for entry_id, coordinator in coordinators.items():
+        async_attach(entry_id, coordinator)
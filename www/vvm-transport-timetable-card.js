@@ -1,5 +1,14 @@
 // VVM Transport Timetable Card
 
+const TYPE_TO_COLOR = {
+    "Bus":"#0000FF",
+    "Straßenbahn":"#FF8000",
+}
+const TYPE_TO_LABEL = {
+    "Bus":"Bus",
+    "Straßenbahn":"Str"
+}
+
 class VVMTransportTimetableCard extends HTMLElement {
     constructor() {
         super();
@@ -10,21 +19,86 @@ class VVMTransportTimetableCard extends HTMLElement {
 
     /* This is called every time sensor is updated */
     set hass(hass) {
+        this._hass = hass;
+        if (this._streaming) {
+            // departures are pushed by the subscription, see _applyDelta
+            return;
+        }
+        if (!this._subscription && !this._streamFailed) {
+            this._subscribe();
+        }
+        this._renderAttributes(hass);
+    }
 
+    get _entityIds() {
         const config = this.config;
-        const maxEntries = config.max_entries || 10;
-        const showStopName = config.show_stop_name || (config.show_stop_name === undefined);
-        const entityIds = config.entity ? [config.entity] : config.entities || [];
-        const show_cancelled = false;
+        return config.entity ? [config.entity] : config.entities || [];
+    }
+
+    get _maxEntries() {
+        return this.config.max_entries || 10;
+    }
+
+    get _showStopName() {
+        return this.config.show_stop_name || (this.config.show_stop_name === undefined);
+    }
+
+    /* Subscribe to departure deltas, entities that are no VVM stops keep using the attributes */
+    _subscribe() {
+        const hass = this._hass;
+        if (!hass || !hass.connection || !this.isConnected || this._entityIds.length == 0) {
+            return;
+        }
+        // events of an older subscription may still arrive after unsubscribing
+        const generation = this._generation = (this._generation || 0) + 1;
+        this._subscription = hass.connection.subscribeMessage(
+            (event) => generation === this._generation && this._applyDelta(event),
+            {
+                type: "vvm_public_transport/subscribe_departures",
+                entity_ids: this._entityIds,
+            }
+        );
+        this._subscription.catch(() => {
+            if (generation !== this._generation) {
+                return;
+            }
+            this._streamFailed = true;
+            this._subscription = undefined;
+            if (this._hass) {
+                this._renderAttributes(this._hass);
+            }
+        });
+    }
 
-        let type_to_color = {
-            "Bus":"#0000FF",
-            "Straßenbahn":"#FF8000",
+    _unsubscribe() {
+        this._generation = (this._generation || 0) + 1;
+        if (this._subscription) {
+            this._subscription.then((unsub) => unsub()).catch(() => {});
+            this._subscription = undefined;
+        }
+        this._streaming = false;
+        if (this._timer) {
+            clearInterval(this._timer);
+            this._timer = undefined;
         }
-        let type_to_label = {
-            "Bus":"Bus",
-            "Straßenbahn":"Str"
+    }
+
+    connectedCallback() {
+        if (this._hass && this.config && !this._subscription && !this._streamFailed) {
+            this._subscribe();
         }
+    }
+
+    disconnectedCallback() {
+        this._unsubscribe();
+    }
+
+    _renderAttributes(hass) {
+
+        const maxEntries = this._maxEntries;
+        const showStopName = this._showStopName;
+        const entityIds = this._entityIds;
+        const show_cancelled = false;
 
         let content = "";
 
@@ -43,10 +117,13 @@ class VVMTransportTimetableCard extends HTMLElement {
 
             const staleColorStyle = isStale ? `style="color: #808080"` : '';
 
-            const departures = 'departures' in entity.attributes ? entity.attributes.departures : []
+            // compact attribute mode publishes rows of the fields in departure_fields
+            const fields = entity.attributes.departure_fields;
+            const departures = ('departures' in entity.attributes ? entity.attributes.departures : [])
+                .map((d) => Array.isArray(d) && fields ? Object.fromEntries(fields.map((f, i) => [f, d[i]])) : d);
             const timetable = departures.slice(0, maxEntries).map((departure) => 
                 `   <div class="line">
-                        <div class="line-icon" style="background-color: ${type_to_color[departure.type] || "#404040"}">${type_to_label[departure.type] || departure.type} ${departure.num}</div>
+                        <div class="line-icon" style="background-color: ${TYPE_TO_COLOR[departure.type] || "#404040"}">${TYPE_TO_LABEL[departure.type] || departure.type} ${departure.num}</div>
                     </div>
                     <div class="direction">${departure.to}</div>
                     <div class="time" ${staleColorStyle}>${departure.left}${departure.delay > 0 ? '(+' + departure.delay + ')' : ''}'</div>
@@ -60,11 +137,150 @@ class VVMTransportTimetableCard extends HTMLElement {
        this.shadowRoot.getElementById('container').innerHTML = content;
     }
 
+    /* Replace the rendered attributes by one section per entity, patched by the deltas */
+    _startStreaming() {
+        this._streaming = true;
+        const container = this.shadowRoot.getElementById('container');
+        container.innerHTML = "";
+        this._stops = {};
+        for (const entityId of this._entityIds) {
+            const header = document.createElement('div');
+            header.className = "stop";
+            header.hidden = !this._showStopName;
+            const grid = document.createElement('div');
+            grid.className = "departures";
+            container.appendChild(header);
+            container.appendChild(grid);
+            this._stops[entityId] = { header, grid, fields: [], rows: new Map(), order: [], stale: false };
+        }
+        this._timer = setInterval(() => {
+            for (const stop of Object.values(this._stops)) {
+                this._updateCountdowns(stop);
+            }
+        }, 10000);
+    }
+
+    _applyDelta(event) {
+        if (!this._streaming) {
+            this._startStreaming();
+        }
+        const stop = this._stops[event.entity_id];
+        if (!stop) {
+            return;
+        }
+        if (event.reset) {
+            stop.rows.forEach((row) => row.el.remove());
+            stop.rows = new Map();
+            stop.fields = event.fields;
+        }
+        stop.stale = event.stale;
+        stop.header.textContent = `${event.stop_name}${event.stale ? '(' + event.last_updated_simple + ')' : ''}`;
+
+        for (const key of event.remove || []) {
+            const row = stop.rows.get(key);
+            if (row) {
+                row.el.remove();
+                stop.rows.delete(key);
+            }
+        }
+        for (const [key, values] of Object.entries(event.upsert || {})) {
+            const departure = Object.fromEntries(stop.fields.map((f, i) => [f, values[i]]));
+            let row = stop.rows.get(key);
+            if (!row) {
+                row = this._createRow();
+                stop.rows.set(key, row);
+            }
+            this._patchRow(row, departure);
+        }
+        if (event.order) {
+            stop.order = event.order;
+        }
+        this._layout(stop);
+        this._updateCountdowns(stop);
+    }
+
+    _createRow() {
+        const el = document.createElement('div');
+        el.className = "row";
+        el.innerHTML = `
+            <div class="line"><div class="line-icon"></div></div>
+            <div class="direction"></div>
+            <div class="time left"></div>
+            <div class="time real"></div>
+        `;
+        return {
+            el,
+            icon: el.querySelector('.line-icon'),
+            direction: el.querySelector('.direction'),
+            left: el.querySelector('.left'),
+            real: el.querySelector('.real'),
+            departure: {},
+        };
+    }
+
+    _patchRow(row, departure) {
+        const old = row.departure;
+        if (old.type !== departure.type || old.num !== departure.num) {
+            row.icon.style.backgroundColor = TYPE_TO_COLOR[departure.type] || "#404040";
+            row.icon.textContent = `${TYPE_TO_LABEL[departure.type] || departure.type} ${departure.num}`;
+        }
+        if (old.to !== departure.to) {
+            row.direction.textContent = departure.to;
+        }
+        if (old.real_time_simple !== departure.real_time_simple) {
+            row.real.textContent = departure.real_time_simple;
+        }
+        row.departure = departure;
+        row.leftText = undefined;
+    }
+
+    /* Put the first max_entries rows into the grid in order, moving only misplaced ones */
+    _layout(stop) {
+        const grid = stop.grid;
+        let previous = null;
+        for (const key of stop.order.slice(0, this._maxEntries)) {
+            const row = stop.rows.get(key);
+            if (!row) {
+                continue;
+            }
+            const expected = previous ? previous.nextSibling : grid.firstChild;
+            if (row.el !== expected) {
+                grid.insertBefore(row.el, expected);
+            }
+            previous = row.el;
+        }
+        let extra;
+        while ((extra = previous ? previous.nextSibling : grid.firstChild)) {
+            extra.remove();
+        }
+    }
+
+    /* The countdowns are derived from the realtime, so they advance without any message */
+    _updateCountdowns(stop) {
+        const now = Math.floor(Date.now() / 60000);
+        const color = stop.stale ? "#808080" : "";
+        for (const row of stop.rows.values()) {
+            const departure = row.departure;
+            const left = Math.max(0, Math.floor(departure.real_time / 60000) - now);
+            const text = `${left}${departure.delay > 0 ? '(+' + departure.delay + ')' : ''}'`;
+            if (row.leftText !== text) {
+                row.left.textContent = text;
+                row.leftText = text;
+            }
+            if (row.left.style.color !== color) {
+                row.left.style.color = color;
+                row.real.style.color = color;
+            }
+        }
+    }
+
     /* This is called only when config is updated */
     setConfig(config) {
         const root = this.shadowRoot;
         if (root.lastChild) root.removeChild(root.lastChild);
 
+        this._unsubscribe();
+        this._streamFailed = false;
         this.config = config;
 
         const card = document.createElement('ha-card');
@@ -93,6 +309,9 @@ class VVMTransportTimetableCard extends HTMLElement {
                 grid-template-columns: min-content 1fr min-content min-content;
                 gap: 10px;
             }
+            .row {
+                display: contents;
+            }
             .line {
                 min-width: 70px;
                 text-align: right;
@@ -126,6 +345,9 @@ class VVMTransportTimetableCard extends HTMLElement {
         card.appendChild(content);
 
         root.appendChild(card);
+        if (this._hass) {
+            this._subscribe();
+        }
       }
   
     // The height of the card.